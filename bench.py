@@ -0,0 +1,244 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# benchmark of invoice.py on synthetic client tables and templates
+# - no display, workbook or operator needed: every row is included as is
+# - each stage is timed and the results go to a json report; the write phase
+#   runs through invoice.write_outputs, so the docs are streamed as in a real
+#   run and the --jobs, --cache, --volumes and --shard-size settings are
+#   measured too
+#
+# example use: python code/bench.py --sizes 100,1000 --out bench_report.json
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+# LIBRARIES
+
+import os
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import datetime
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+import invoice
+import instrument
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# SYNTHETIC INPUTS
+
+##### cond/filt month strings as they show up in client files
+month_strings = ['exclude', 'March', 'March, September', 'June, December',
+                 'January, April, July, October', 'Sept']
+
+##### word doc with one paragraph per line
+def make_doc(path, lines):
+    import docx
+    doc = docx.Document()
+    for line in lines:
+        doc.add_paragraph(line)
+    doc.save(path)
+    return
+
+##### minimal versions of the five word templates
+def make_templates(template_dir):
+    basic = ['{{ DATE }}',
+             '{{ FIRST }} {{ LAST }}',
+             '{{ STREET_ADDRESS }}',
+             '{{ CITY_ADDRESS }}',
+             'Service for {{ MONTH }} {{ YEAR }}: {{ MONTHLY_CHARGE }}',
+             'Additional: {{ ADD_CHARGE }} {{ ADD_CHARGE_NOTES }}',
+             'Total: {{ TOTAL }}',
+             '{{ CUST_REMINDER }}']
+    make_doc(template_dir+'/fpage.docx', ['Invoices'])
+    make_doc(template_dir+'/invoice_template.docx', basic)
+    make_doc(template_dir+'/invoice_template_z.docx', ['Z'] + basic)
+    make_doc(template_dir+'/invoice_template_v.docx', ['V'] + basic)
+    make_doc(template_dir+'/invoice_template_mult.docx',
+             ['{{ DATE }}',
+              '{{ M1 }} {{ A1 }} {{ A1_NOTES }}',
+              '{{ M2 }} {{ A2 }} {{ A2_NOTES }}',
+              '{{ M3 }} {{ A3 }} {{ A3_NOTES }}',
+              'Total: {{ TOTAL }}',
+              '{{ CUST_REMINDER }}'])
+    return
+
+##### synthetic client table of n rows
+# - about a third of the clients get email, the rest paper
+# - PP/GG split evenly, a few RP/Z/V clients, mixed cond/filt months
+def make_table(n, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        email = rng.random() < 0.35
+        rows.append({
+            'OWNER': 'owner',
+            'DIRECTION': rng.choice(['PP', 'GG']),
+            'FIRST': 'First%d' % i if rng.random() < 0.9 else 'Mary Ann %d' % i,
+            'LAST': 'Last%d' % i,
+            'STREET_ADDRESS': '%d Main St' % (i+1),
+            'CITY_ADDRESS': rng.choice(['Springfield', 'Shelbyville', 'Ogdenville']),
+            'MY_NOTES': 'gate code %d' % i if rng.random() < 0.2 else None,
+            'MONTHLY_CHARGE': round(rng.uniform(20, 900), 2),
+            'EMAIL_ADDRESS': 'client%d@example.com' % i if email else 'NA',
+            'EMAIL_IND': 1 if email else 0,
+            'COND_CHARGE': 45.0,
+            'FILT_CHARGE': 20.0,
+            'COND_MONTHS': rng.choice(month_strings),
+            'FILT_MONTHS': rng.choice(month_strings),
+            'RP_INDICATOR': 1 if rng.random() < 0.01 else 0,
+            'Z_INDICATOR': 1 if rng.random() < 0.05 else 0,
+            'V_INDICATOR': 1 if rng.random() < 0.05 else 0})
+    return pd.DataFrame(rows, columns=invoice.col_list)
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# STAGES
+
+##### run and time one stage -> (result, seconds)
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter()-start
+
+##### time every stage for one table size
+# - the write phase is the program's own (invoice.write_outputs): the docs are
+#   streamed through render, compose and save, and its stage timers are read
+#   from instrument.run_stats
+# - cache: use a render cache in the work directory
+# - shard_size, volumes: write the paper masters as volumes of shard_size
+#   invoices
+def bench_size(n, work_dir, month, year, n_jobs=1, fast=False, cache=False,
+               shard_size=100, volumes=False):
+    from render import RenderCache
+
+    template_dir = work_dir+'/templates'
+    os.makedirs(template_dir)
+    make_templates(template_dir)
+    paths = invoice.template_paths(template_dir)
+    stages = {}
+
+    ##### data
+    tabl, stages['make_table'] = timed(make_table, n)
+    def write_workbook():
+        tabl.to_excel(paths['invoice_data_template'], index=False)
+    _, stages['write_workbook'] = timed(write_workbook)
+    # cold: the workbook is parsed; warm: the snapshot next to it is read
+    tabl, stages['load_cold'] = timed(invoice.load_table, paths['invoice_data_template'])
+    tabl, stages['load_warm'] = timed(invoice.load_table, paths['invoice_data_template'])
+    included = np.ones(tabl.shape[0], dtype=int)
+    _, stages['reminders'] = timed(invoice.build_reminders, tabl, month)
+
+    ##### render contexts, on their own: the jobs are counted, not kept
+    tabl['TOTAL'] = tabl['MONTHLY_CHARGE'] + tabl['ADD_CHARGE']
+    tabl['INCLUDED'] = included
+    date = datetime.datetime.today().strftime('%B %d, %Y')
+    def build():
+        return sum(1 for job in invoice.build_jobs(tabl, included, month, year, date, paths))
+    n_jobs_built, stages['contexts'] = timed(build)
+
+    ##### write phase: render, compose, email save, masters, spreadsheets
+    dirs = invoice.make_directories(month, year, work_dir+'/invoices')
+    render_cache = RenderCache(work_dir+'/render_cache') if cache else None
+    def write(incremental):
+        return invoice.write_outputs(tabl, included, month, year, paths, dirs, n_jobs,
+                                     render_cache, incremental, shard_size, volumes, fast)
+    instrument.reset_stats()
+    _, stages['write'] = timed(write, False)
+    write_report = instrument.run_report()
+    for name, secs in write_report['stages'].items():
+        stages['write_'+name] = secs
+
+    ##### same month again: nothing changed, the manifest keeps every output
+    instrument.reset_stats()
+    _, stages['rewrite'] = timed(write, True)
+
+    email_ind = tabl['EMAIL_IND'].to_numpy()
+    return {'rows': n,
+            'jobs': n_jobs_built,
+            'paper': int((email_ind == 0).sum()),
+            'email': int((email_ind == 1).sum()),
+            'stages': stages,
+            'templates': write_report['templates'],
+            'bytes_written': write_report['bytes_written'],
+            'total': sum([secs for name, secs in stages.items()
+                          if not name.startswith('write_')])}
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# REPORT
+
+##### commit of the code being measured, if this is a git checkout
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                             text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Time each stage of invoice.py on synthetic data.')
+    parser.add_argument('--sizes', default='100,1000,10000,100000',
+                        help='comma separated table sizes')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of processes used to render the invoices')
+    parser.add_argument('--fast-render', action='store_true',
+                        help='use the fast path renderer')
+    parser.add_argument('--cache', action='store_true',
+                        help='use a render cache, the rewrite stage then reads it')
+    parser.add_argument('--shard-size', type=int, default=100,
+                        help='paper invoices per volume of a --volumes run')
+    parser.add_argument('--volumes', action='store_true',
+                        help='write the paper masters as volumes')
+    parser.add_argument('--month', default='September')
+    parser.add_argument('--year', default='2019')
+    parser.add_argument('--out', default='bench_report.json',
+                        help='json report path')
+    parser.add_argument('--keep', action='store_true',
+                        help='keep the generated files')
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    report = {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+              'commit': git_commit(),
+              'python': platform.python_version(),
+              'pandas': pd.__version__,
+              'platform': platform.platform(),
+              'jobs': args.jobs,
+              'fast_render': args.fast_render,
+              'cache': args.cache,
+              'shard_size': args.shard_size,
+              'volumes': args.volumes,
+              'results': []}
+    for n in sizes:
+        work_dir = tempfile.mkdtemp(prefix='bench_%d_' % n)
+        try:
+            result = bench_size(n, work_dir, args.month, args.year,
+                                max(1, args.jobs), args.fast_render, args.cache,
+                                max(1, args.shard_size), args.volumes)
+        finally:
+            if args.keep:
+                print('Files kept in %s' % work_dir)
+            else:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        report['results'].append(result)
+        print('%d rows: %s' % (n, ', '.join(['%s %.2f s' % (stage, secs)
+                                  for stage, secs in result['stages'].items()])))
+        # written after every size so a long run keeps what it has
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=1)
+
+    print('Report written to %s.' % args.out)
+    return
+
+if __name__ == '__main__':
+    main()
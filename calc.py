@@ -0,0 +1,225 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# arithmetic expressions for invoice.py
+# - the charges typed into the gui, the --batch amounts and the formula columns
+#   of the workbook are all small expressions: numbers, + - * /, parentheses
+#   and percent, e.g. '450 + 12.5', '(3*15)/2', '500 - 10%'
+# - nothing is handed to python's eval; anything else is a CalcError
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+# LIBRARIES
+
+import re
+from decimal import Decimal, InvalidOperation, DivisionByZero
+
+import numpy as np
+
+from money import decimal_cents
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# PARSER
+# expr    := term (('+' | '-') term)*
+# term    := unary (('*' | '/') unary)*
+# unary   := ('+' | '-') unary | percent
+# percent := atom '%'*          -- x% is x/100
+# atom    := number | name | '(' expr ')'
+# -- numbers may have a '$' and commas between thousands, e.g. '$1,250.50';
+# -- any other comma is an error, '1,5' is not read as 15
+# -- names are columns of the table, only in the formula columns
+# -- each text is parsed once, the trees are kept in compiled
+
+##### problem with an expression
+class CalcError(ValueError):
+    pass
+
+token_re = re.compile(r'\s*(?:(?P<num>\d[\d,]*(?:\.\d*)?|\.\d+)|'
+                      r'(?P<name>[A-Za-z_][A-Za-z0-9_]*)|(?P<op>[-+*/()%]))')
+number_re = re.compile(r'(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d*)?|\.\d+')
+
+##### text -> {'tree': parsed expression, 'names': names it uses}
+compiled = {}
+
+##### largest amount in dollars, the cents have to be exact as int64 and float
+max_dollars = 2**53 // 100
+
+##### split an expression into (kind, text) tokens
+def tokenize(text):
+    tokens = []
+    text = text.replace('$', '').rstrip()
+    pos = 0
+    while pos < len(text):
+        match = token_re.match(text, pos)
+        if match is None:
+            raise CalcError("can not read '%s'" % text[pos:].strip())
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'num':
+            if not number_re.fullmatch(value):
+                raise CalcError("can not read the number '%s', "
+                                "commas only go between thousands" % value)
+            value = value.replace(',', '')
+        tokens.append((kind, value))
+        pos = match.end()
+    return tokens
+
+##### parse tokens into a tree of tuples: ('num', text), ('name', text),
+##### ('neg', x), ('pct', x), ('+', x, y), ('-', x, y), ('*', x, y), ('/', x, y)
+class Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if len(self.tokens) == 0:
+            raise CalcError('empty expression')
+        tree = self.expr()
+        if self.pos < len(self.tokens):
+            raise CalcError("unexpected '%s'" % self.peek()[1])
+        return tree
+
+    def expr(self):
+        tree = self.term()
+        while self.peek() in [('op', '+'), ('op', '-')]:
+            op = self.take()[1]
+            tree = (op, tree, self.term())
+        return tree
+
+    def term(self):
+        tree = self.unary()
+        while self.peek() in [('op', '*'), ('op', '/')]:
+            op = self.take()[1]
+            tree = (op, tree, self.unary())
+        return tree
+
+    def unary(self):
+        if self.peek() == ('op', '-'):
+            self.take()
+            return ('neg', self.unary())
+        if self.peek() == ('op', '+'):
+            self.take()
+            return self.unary()
+        return self.percent()
+
+    def percent(self):
+        tree = self.atom()
+        while self.peek() == ('op', '%'):
+            self.take()
+            tree = ('pct', tree)
+        return tree
+
+    def atom(self):
+        kind, value = self.take()
+        if kind == 'num':
+            return ('num', value)
+        if kind == 'name':
+            return ('name', value)
+        if (kind, value) == ('op', '('):
+            tree = self.expr()
+            if self.take() != ('op', ')'):
+                raise CalcError("missing ')'")
+            return tree
+        if kind is None:
+            raise CalcError('the expression ends too soon')
+        raise CalcError("unexpected '%s'" % value)
+
+##### names used by a tree
+def tree_names(tree, names):
+    if tree[0] == 'name':
+        names.add(tree[1])
+    elif tree[0] != 'num':
+        for child in tree[1:]:
+            tree_names(child, names)
+    return names
+
+##### parsed expression, from compiled if seen before
+def compile_expr(text):
+    expr = compiled.get(text)
+    if expr is None:
+        try:
+            tree = Parser(tokenize(text)).parse()
+        except RecursionError:
+            raise CalcError('the expression is nested too deeply')
+        expr = {'tree': tree, 'names': tree_names(tree, set())}
+        compiled[text] = expr
+    return expr
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# EVALUATION
+# the same tree is worked out with decimals for one amount and with numpy
+# arrays for a column
+
+##### value of a tree
+# - number: turns the text of a number into a value
+# - env: name -> value
+def evaluate(tree, number, env):
+    op = tree[0]
+    if op == 'num':
+        return number(tree[1])
+    if op == 'name':
+        return env[tree[1]]
+    if op == 'neg':
+        return -evaluate(tree[1], number, env)
+    if op == 'pct':
+        return evaluate(tree[1], number, env) / number('100')
+    left = evaluate(tree[1], number, env)
+    right = evaluate(tree[2], number, env)
+    if op == '+':
+        return left + right
+    if op == '-':
+        return left - right
+    if op == '*':
+        return left * right
+    return left / right
+
+##### value of an amount typed in -> Decimal
+def eval_number(text):
+    expr = compile_expr(text)
+    if len(expr['names']) > 0:
+        raise CalcError("'%s' is not a number" % sorted(expr['names'])[0])
+    try:
+        return evaluate(expr['tree'], Decimal, {})
+    except (DivisionByZero, ZeroDivisionError):
+        raise CalcError('division by zero')
+    except (InvalidOperation, RecursionError):
+        raise CalcError('can not work out the amount')
+
+##### amount typed in, in dollars -> int cents
+def eval_cents(text):
+    value = eval_number(text)
+    if abs(value) > max_dollars:
+        raise CalcError('the amount is too large')
+    return decimal_cents(value)
+
+##### value of an expression for every row -> float array of n values
+# - columns: name -> float array of n values
+def eval_array(text, columns, n):
+    expr = compile_expr(text)
+    unknown = sorted(expr['names'] - set(columns))
+    if len(unknown) > 0:
+        raise CalcError("unknown column '%s'" % unknown[0])
+    env = {name: columns[name] for name in expr['names']}
+    try:
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            values = evaluate(expr['tree'], float, env)
+    except (ZeroDivisionError, RecursionError):
+        # constants are python floats, e.g. '1/0'
+        raise CalcError('division by zero or a blank value')
+    values = np.broadcast_to(np.asarray(values, dtype=float), (n,))
+    if not np.isfinite(values).all():
+        raise CalcError('division by zero or a blank value')
+    if (np.abs(values) > max_dollars).any():
+        raise CalcError('the amount is too large')
+    return values
@@ -0,0 +1,401 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# composition of the paper master docs for invoice.py
+# - a master is the first page followed by every paper invoice, each after a
+#   page break
+# - a master is composed in one process by FastComposer; masters written as
+#   volumes are composed a volume per worker process
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+# LIBRARIES
+
+import io
+import shutil
+import hashlib
+import zipfile
+import tempfile
+from copy import deepcopy
+from collections import deque
+
+from lxml import etree
+from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.part import XmlPart
+from docxcompose.composer import Composer, CustomProperties, CT_SectPr
+from docxcompose.utils import NS, xpath
+from concurrent.futures import Future
+
+from render import load_doc
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# FAST COMPOSER
+# every invoice comes from one of a few templates, so after the first invoice
+# of a template has gone through Composer the rest are spliced in directly
+# -- the first append of a template runs the full Composer logic (styles,
+# -- images, relationships) and records how it rewrote the attributes of the
+# -- body, e.g. rId7 -> rId12; later docs of the template get the same rewrite
+# -- Composer renumbers the bookmarks and drawing ids of the whole master on
+# -- every append, the spliced docs leave that to one pass before saving
+# -- docs with anything the recorded rewrite does not cover (a new style or
+# -- relationship, numbering, footnotes, sections) go through Composer
+# -- with spill_size set, the finished part of the body is written to a temp
+# -- file once it holds that many elements (see SPILL)
+
+def qn(tag):
+    prefix, name = tag.split(':')
+    return '{%s}%s' % (NS[prefix], name)
+
+##### attributes that point at styles or relationships of the doc
+r_ns = '{%s}' % NS['r']
+style_refs = set((qn(tag), qn('w:val')) for tag in ['w:pStyle', 'w:rStyle', 'w:tblStyle'])
+##### ids Composer renumbers over the whole doc
+renumbered = set([(qn('wp:docPr'), 'id'), (qn('pic:cNvPr'), 'id'),
+                  (qn('w:bookmarkStart'), qn('w:id')), (qn('w:bookmarkEnd'), qn('w:id'))])
+##### elements that always need Composer
+composer_only = set([qn('w:numPr'), qn('w:numId'), qn('w:footnoteReference'),
+                     qn('w:endnoteReference'), qn('w:sectPr'),
+                     qn('w:headerReference'), qn('w:footerReference')])
+
+def is_ref(tag, attr):
+    return attr.startswith(r_ns) or (tag, attr) in style_refs
+
+##### Composer that splices in docs of templates it has already merged
+# - spill_size: body elements kept in memory, None keeps the whole body
+class FastComposer(Composer):
+    def __init__(self, doc, preserve_styles=False, spill_size=None):
+        Composer.__init__(self, doc, preserve_styles)
+        self.rewrites = {} # template key -> {(tag, attr): {old: new}}, None if not usable
+        self.renumber_pending = False
+        self.parts_removed = 0 # duplicate parts left out of the last save
+        self.spill_size = spill_size
+        self.spill = None # temp file of the spilled body xml
+        self.spilled = dict.fromkeys(numbered, 0) # ids used by the spilled body
+
+    # the section properties are the last child of the body
+    def append_index(self):
+        body = self.doc.element.body
+        if len(body) > 0 and isinstance(body[-1], CT_SectPr):
+            return len(body)-1
+        return Composer.append_index(self)
+
+    # append a doc, key: the template it was rendered from
+    def append(self, doc, key=None, remove_property_fields=True):
+        # Remove custom property fields but keep the values
+        if remove_property_fields:
+            cprops = CustomProperties(doc)
+            for name in cprops.keys():
+                cprops.dissolve_fields(name)
+        rewrite = self.rewrites.get(key)
+        if rewrite is None or not self.splice(doc, rewrite):
+            if self.renumber_pending:
+                self.renumber()
+            index = self.append_index()
+            self.insert(index, doc, remove_property_fields=False)
+            if key is not None and key not in self.rewrites:
+                self.rewrites[key] = self.record_rewrite(doc, index)
+        if self.spill_size is not None and self.append_index() >= self.spill_size:
+            self.spill_body()
+        return
+
+    # attribute rewrite done by Composer to the doc inserted at index
+    def record_rewrite(self, doc, index):
+        rewrite = {}
+        body = self.doc.element.body
+        for element in doc.element.body:
+            if isinstance(element, CT_SectPr):
+                continue
+            src_els = list(element.iter())
+            dst_els = list(body[index].iter())
+            index += 1
+            if len(src_els) != len(dst_els):
+                return None
+            for src, dst in zip(src_els, dst_els):
+                if src.tag != dst.tag or src.tag in composer_only:
+                    return None
+                if set(src.attrib.keys()) != set(dst.attrib.keys()):
+                    return None
+                for attr, value in src.attrib.items():
+                    new_value = dst.get(attr)
+                    if is_ref(src.tag, attr):
+                        refs = rewrite.setdefault((src.tag, attr), {})
+                        if refs.setdefault(value, new_value) != new_value:
+                            return None
+                    elif value != new_value and (src.tag, attr) not in renumbered:
+                        return None
+        return rewrite
+
+    # splice the body of the doc in with a recorded rewrite, False if it
+    # does not cover the doc
+    def splice(self, doc, rewrite):
+        elements = []
+        for element in doc.element.body:
+            if isinstance(element, CT_SectPr):
+                continue
+            element = deepcopy(element)
+            for el in element.iter():
+                if el.tag in composer_only:
+                    return False
+                for attr, value in el.attrib.items():
+                    if not is_ref(el.tag, attr):
+                        continue
+                    refs = rewrite.get((el.tag, attr))
+                    if refs is None or value not in refs:
+                        return False
+                    el.set(attr, refs[value])
+            elements.append(element)
+        body = self.doc.element.body
+        index = self.append_index()
+        for element in elements:
+            body.insert(index, element)
+            index += 1
+        self.renumber_pending = True
+        return True
+
+    # what Composer does after every append, once for the spliced docs
+    def renumber(self):
+        self.renumber_bookmarks()
+        self.renumber_docpr_ids()
+        self.renumber_nvpicpr_ids()
+        self.renumber_pending = False
+        return
+
+    # Composer's renumbering, carried on from the spilled body
+    def renumber_bookmarks(self):
+        self.renumber_ids('.//w:bookmarkStart')
+        self.renumber_ids('.//w:bookmarkEnd')
+
+    def renumber_docpr_ids(self):
+        self.renumber_ids('.//wp:docPr')
+
+    def renumber_nvpicpr_ids(self):
+        self.renumber_ids('.//pic:cNvPr')
+
+    # number the elements of the body in order, after the spilled ones
+    # -- drawing ids go on in the headers and footers, as Composer does it
+    def renumber_ids(self, path):
+        first, attr, hdrftr = numbered[path]
+        k = first + self.spilled[path]
+        elements = xpath(self.doc.element.body, path)
+        if hdrftr:
+            for rel in self.doc.part.rels.values():
+                if rel.reltype in [RT.HEADER, RT.FOOTER]:
+                    elements += xpath(rel.target_part.element, path)
+        for element in elements:
+            element.set(attr, str(k))
+            k += 1
+        return
+
+    def save(self, filename):
+        if self.renumber_pending:
+            self.renumber()
+        self.parts_removed = dedupe_parts(self.doc)
+        if self.spill is None:
+            Composer.save(self, filename)
+        else:
+            self.save_spilled(filename)
+
+    ##### spilling, see SPILL
+
+    # empty document element of the master -> (element, xml before the
+    # children of its body, xml after them)
+    def shell(self):
+        root = self.doc.element
+        shell = etree.Element(root.tag, nsmap=root.nsmap)
+        etree.SubElement(shell, root.body.tag).text = spill_mark
+        head, tail = etree.tostring(shell, encoding='UTF-8').split(spill_mark.encode())
+        return shell, head, tail
+
+    # write the body elements before the section properties to the spill file
+    def spill_body(self):
+        if self.renumber_pending:
+            self.renumber()
+        body = self.doc.element.body
+        shell, head, tail = self.shell()
+        shell_body = shell[0]
+        shell_body.text = None
+        for element in body[:self.append_index()]:
+            shell_body.append(element) # moved out of the master
+        for path in self.spilled:
+            self.spilled[path] += len(xpath(shell_body, path))
+        if self.spill is None:
+            self.spill = tempfile.TemporaryFile()
+        self.spill.write(etree.tostring(shell, encoding='UTF-8')[len(head):-len(tail)])
+        return
+
+    # save with the spilled body streamed in at the start of document.xml
+    def save_spilled(self, filename):
+        body = self.doc.element.body
+        mark = etree.Comment(spill_mark)
+        body.insert(0, mark)
+        buf = io.BytesIO()
+        try:
+            Composer.save(self, buf)
+        finally:
+            body.remove(mark)
+        mark_bytes = etree.tostring(mark)
+        body_name = self.doc.part.partname[1:]
+        spill_bytes = self.spill.tell()
+        with zipfile.ZipFile(buf) as src, \
+             zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED) as dst:
+            for info in src.infolist():
+                if info.filename != body_name:
+                    dst.writestr(info, src.read(info))
+                    continue
+                head, tail = src.read(info).split(mark_bytes)
+                with dst.open(info, 'w', force_zip64=spill_bytes > 2**30) as out:
+                    out.write(head)
+                    self.spill.seek(0)
+                    shutil.copyfileobj(self.spill, out)
+                    out.write(tail)
+        return
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# SPILL
+# a master's body grows with every paper invoice; once it holds spill_size
+# elements, the finished ones are written to a temp file and dropped from the
+# tree, so the master in memory does not grow with the number of clients
+# -- Composer numbers the bookmarks and drawing ids in body order, the spilled
+# -- elements keep theirs and the ones still in the tree are numbered after
+# -- Composer finds the sections of a doc with several by counting from the
+# -- end of the master (see Composer.fix_section_types), so the sections in
+# -- the spilled body do not change them
+# -- save writes document.xml with the spilled body streamed in
+
+##### body elements of a master kept in memory
+master_spill_size = 5000
+spill_mark = 'SPILLED-BODY'
+
+##### ids Composer numbers in body order: xpath -> (first id, attribute, whether
+##### the headers and footers are numbered after the body)
+numbered = {'.//w:bookmarkStart': (0, qn('w:id'), False),
+            './/w:bookmarkEnd': (0, qn('w:id'), False),
+            './/wp:docPr': (1, 'id', True),
+            './/pic:cNvPr': (1, 'id', True)}
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# DEDUPE PARTS
+# Composer copies the binary parts an appended doc points at by r:id (embedded
+# objects and their previews) on every full append
+# -- identical parts are found by content type and hash, every relationship is
+# -- pointed at the first copy and the others are left out of the saved doc
+# -- only parts without relationships of their own, i.e. media and embeddings
+
+##### point the references to identical parts at one copy -> copies removed
+def dedupe_parts(doc):
+    package = doc.part.package
+    sources = [package] + list(package.iter_parts())
+    first = {} # (content type, sha256) -> part
+    copy_of = {} # part -> first copy
+    for part in sources[1:]:
+        if isinstance(part, XmlPart) or len(part.rels) > 0:
+            continue
+        key = (part.content_type, hashlib.sha256(part.blob).hexdigest())
+        if key in first:
+            copy_of[part] = first[key]
+        else:
+            first[key] = part
+    if len(copy_of) == 0:
+        return 0
+    for source in sources:
+        for rel in source.rels.values():
+            if rel.is_external or rel.target_part not in copy_of:
+                continue
+            rel._target = copy_of[rel.target_part]
+            source.rels.related_parts[rel.rId] = rel._target
+    return len(copy_of)
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# COMPOSE DOCS
+
+##### append docs to a base doc, each after a page break -> docx bytes
+# - keys: optional template of each doc, see FastComposer
+# - runs in the worker processes
+def compose_docs(base_bytes, doc_bytes_list, keys=None):
+    composer = FastComposer(Document(io.BytesIO(base_bytes)))
+    for k, doc_bytes in enumerate(doc_bytes_list):
+        # add page break
+        composer.doc.add_page_break()
+        # merge it with the doc
+        if keys is None or keys[k] is None:
+            composer.append(Document(io.BytesIO(doc_bytes)))
+        else:
+            composer.append(load_doc(keys[k], doc_bytes), keys[k])
+    buf = io.BytesIO()
+    composer.save(buf)
+    return buf.getvalue()
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# SHARDED MASTER
+
+##### paper master as volumes of shard_size invoices, each starting with the
+# first page
+# - paths: path of every volume, in order
+# - pool: process pool the volumes are composed in, None composes them here
+# - max_pending: volumes composed or waiting to be written at a time
+# -- a volume is composed on its own, so the volumes of a master are composed
+# -- in parallel; one master is composed by a single FastComposer, merging
+# -- shards would run the full Composer logic on every merge
+# -- volumes are written as they are done, in order, so at most max_pending
+# -- of them are held in memory
+class ShardedMaster:
+    def __init__(self, fpage_bytes, paths, pool=None, shard_size=100, max_pending=2):
+        self.fpage_bytes = fpage_bytes
+        self.paths = paths
+        self.pool = pool
+        self.shard_size = shard_size
+        self.max_pending = max_pending
+        self.docs = [] # invoices of the volume being filled
+        self.keys = [] # and their templates
+        self.shards = deque() # futures of the volumes not written yet, in order
+        self.written = 0 # volumes written
+
+    # run in the pool or here, as a future either way
+    def submit(self, fn, *args):
+        if self.pool is not None:
+            return self.pool.submit(fn, *args)
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    # add the next invoice, docx bytes, and the template it was rendered from
+    def add(self, doc_bytes, key=None):
+        self.docs.append(doc_bytes)
+        self.keys.append(key)
+        if len(self.docs) >= self.shard_size:
+            self.flush()
+        return
+
+    # compose the volume being filled
+    def flush(self):
+        if len(self.docs) == 0:
+            return
+        self.shards.append(self.submit(compose_docs, self.fpage_bytes,
+                                       self.docs, self.keys))
+        self.docs = []
+        self.keys = []
+        self.write_done(self.max_pending)
+        return
+
+    # write the volumes that are done, waiting while more than pending are left
+    def write_done(self, pending):
+        while len(self.shards) > 0 and (len(self.shards) > pending or self.shards[0].done()):
+            doc_bytes = self.shards.popleft().result()
+            with open(self.paths[self.written], 'wb') as f:
+                f.write(doc_bytes)
+            self.written += 1
+        return
+
+    # compose and write the rest of the volumes
+    def finish(self):
+        self.flush()
+        self.write_done(0)
+        if self.written == 0: # no invoices, only the first page
+            with open(self.paths[0], 'wb') as f:
+                f.write(self.fpage_bytes)
+        return
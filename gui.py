@@ -0,0 +1,731 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# gui session for invoice.py
+# - the operator works through the rows of the client table one at a time
+# - every row is handed back through the commit function given to run_session
+# - closing the session starts the write phase on a worker thread and the
+#   window shows its progress until the files are written
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+# LIBRARIES
+
+import tkinter as tk
+from tkinter import ttk
+import time
+import queue
+import threading
+
+from instrument import format_eta, run_profiled
+from money import format_amount, format_money
+from calc import CalcError, eval_cents
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# GLOBAL VARS and CONSTANTS
+
+##### session data - set by run_session
+tabl = None # client table
+included = None # include indicators
+N = 0 # number of rows
+MONTH = ''
+YEAR = ''
+remind_text = [] # cond/filt reminder text for every row
+dates_err = [] # improper cond/filt months for every row
+commit = None # commit(row, monthly, add, add notes, my notes, reminder, include)
+               # - amounts in cents
+write = None # write(listener, cancel) -> total in cents, run when the session is closed
+
+##### write phase - see WRITE PHASE
+write_events = None # queue of ('progress', status), ('done', total), ('error', err)
+write_cancel = None # threading.Event set by the cancel button
+write_error = None # exception the write phase stopped with
+poll_ms = 100 # how often the window looks at the write phase
+
+##### global vars
+# current row
+index = 0
+# indicator for whether or not the 'back button' is on in the gui
+back_on = False
+# indicator for restoring the main gui format upon going back to the main...
+# ...program from the exit screen gui format
+last_back = False
+# error string to attach if we receive improper input
+error_str = ''
+# back string to infrom user we went back a row
+back_str = ''
+# indicator for whether we have finished the main invoicing program
+final_end = False
+# row counter, column counter
+row_inc = 0
+col_inc = 0
+##### last tow of the gui format
+# main->0; month charge->1; add charge->2; notes add char->3; notes->4;
+# cust remind->5; check->6; button one->7; button two->7
+last_row = 7
+
+##### constants for tkinter display windows
+font = 'Times' # font type
+bold_ind = 'bold' # bold indicator
+size = 18 # font size
+col1 = '#14bcfe' #color-> blue-ish
+col2 = '#fe9114' #color -> orange-ish
+notes_color = 'black' # notes color
+reminder_color = 'purple' ## '#cf2b29';'#e34240'; red-ish
+amt_color = 'green' # amount color
+add_color = '#0a4cbf' # #blue-ish
+cust_remind_color = 'red' # cust reminder color
+thick = 2 # highlighted thickness
+pad = 6 # amount of padding
+width = 1000 # width dim -> of the entire window
+height = 800 # height dim -> of the entire window
+entry_width = 80 # width dim of the user input sections
+on_color = 'red' # color of checked button when on
+off_color = 'grey' # color of checked button when off
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# WINDOW FUNCTIONS
+
+##### center the window upon opening with a given width and height
+def center_window(base, width=300, height=200):
+    # get screen width and height
+    screen_width = base.winfo_screenwidth()
+    screen_height = base.winfo_screenheight()
+    # calculate position x and y coordinates
+    x = (screen_width/2) - (width/2)
+    y = (screen_height/2) - (height/2)
+    base.geometry('%dx%d+%d+%d' % (width, height, x, y))
+    return
+
+##### close root i.e. the main program
+def close_root():
+    # global vars
+    global root
+    global final_end
+
+    # set checkpoint
+    final_end = True
+    # write the files with the window up, or leave it to the caller
+    if write is not None:
+        start_write()
+    else:
+        # destroy root
+        root.destroy()
+    return
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# WRITE PHASE
+# the files are written on a worker thread while the tkinter main loop keeps
+# the window responsive; the worker only puts events on write_events, which
+# the main loop polls with after() - tkinter is only touched from the main loop
+# -- cancel sets write_cancel, the worker stops before its next file
+
+##### swap the end screen for the progress view and start the worker
+def start_write():
+    # global vars
+    global write_events, write_cancel, write_error
+    global progress_bar, status_lbl
+
+    write_events = queue.Queue()
+    write_cancel = threading.Event()
+    write_error = None
+
+    ##### progress view
+    btn_two.grid_forget() # no going back now
+    main_lbl.config(text= 'Writing files...')
+    main_lbl.config(fg= 'black')
+    progress_bar = ttk.Progressbar(root, orient= 'horizontal',
+                                   length= width*2//3, mode= 'determinate')
+    progress_bar.grid(row= 1, column= col_inc, pady= pad, columnspan=2)
+    status_lbl = tk.Label(root, text= '', justify= 'left')
+    status_lbl.config(font= (font, size))
+    status_lbl.grid(row= 2, column= col_inc, pady= pad, columnspan=2)
+    btn_one.grid_forget()
+    btn_one.config(text= 'Cancel')
+    btn_one.config(command= cancel_write)
+    btn_one.grid(row= 3, column= col_inc, pady= pad, columnspan=2)
+    # closing the window cancels too
+    root.protocol('WM_DELETE_WINDOW', cancel_write)
+
+    ##### worker
+    threading.Thread(target=run_write, daemon=True).start()
+    root.after(poll_ms, poll_write)
+    return
+
+##### the write phase - runs on the worker thread
+def run_write():
+    def listener(status):
+        write_events.put(('progress', status))
+    try:
+        total = run_profiled(write, listener, write_cancel)
+    except Exception as err:
+        write_events.put(('error', err))
+    else:
+        write_events.put(('done', total))
+    return
+
+##### show what the worker reported since the last poll
+def poll_write():
+    status = None
+    while True:
+        try:
+            kind, value = write_events.get_nowait()
+        except queue.Empty:
+            break
+        if kind == 'progress':
+            status = value # only the latest is shown
+        else:
+            finish_write(kind, value)
+            return
+    if status is not None:
+        show_status(status)
+    root.after(poll_ms, poll_write)
+    return
+
+##### progress bar and status text
+def show_status(status):
+    if status['total'] is None: # a step without items, e.g. saving a master
+        main_lbl.config(text= status['label']+'...')
+        progress_bar.config(mode= 'indeterminate')
+        progress_bar.start()
+        status_lbl.config(text= '')
+        return
+    main_lbl.config(text= 'Writing files...')
+    progress_bar.stop()
+    progress_bar.config(mode= 'determinate', maximum= max(1, status['total']),
+                        value= status['done'])
+    text = '%d of %d invoices' % (status['done'], status['total'])
+    if status['item'] is not None:
+        text = status['item'] + '\n' + text
+    text += '\n%.1f per second' % status['rate']
+    if status['eta'] is not None:
+        text += ', about %s left' % format_eta(status['eta'])
+    status_lbl.config(text= text)
+    return
+
+##### the operator cancelled - the worker stops before its next file
+def cancel_write():
+    write_cancel.set()
+    main_lbl.config(text= 'Cancelling...')
+    btn_one.config(state= 'disabled')
+    return
+
+##### the worker is done: show the outcome and let the operator close
+def finish_write(kind, value):
+    global write_error
+
+    progress_bar.stop()
+    if kind == 'done':
+        progress_bar.config(mode= 'determinate', maximum= 1, value= 1)
+        main_lbl.config(text= 'Files written.')
+        status_lbl.config(text= 'Total: ' + format_money([value])[0])
+    else:
+        write_error = value
+        main_lbl.config(text= 'Files not written.')
+        main_lbl.config(fg= 'red')
+        status_lbl.config(text= str(value))
+    btn_one.config(text= 'Close', state= 'normal')
+    btn_one.config(command= root.destroy)
+    root.protocol('WM_DELETE_WINDOW', root.destroy)
+    return
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# HELPER FUNCTIONS for navigating
+
+# check value of checkbutton
+# - if its clicked, then turn it on to appropriate color
+# - else leave it deafault black color
+def on_check():
+    global var, chk
+    if var.get() == 1:
+        chk["fg"] = on_color
+    else:
+        chk["fg"] = off_color
+    return
+
+##### function to begin the main program
+def begin():
+    # global vars
+    global btn_one, btn_two
+    global monthly_charge_lbl, monthly_charge_entry
+    global add_charge_lbl, add_charge_entry
+    global add_charge_notes_lbl, add_charge_notes_entry
+    global my_notes_lbl, my_notes_entry
+    global cust_reminder_lbl, cust_reminder_entry
+    global chk
+    global row_inc, col_inc
+
+    ##### main label
+    main_lbl.grid_forget()
+
+    ##### first button
+    # change text: begin -> next
+    # change command
+    # if clicked, we move to the next row
+    # for proper display, we forget it so that we can place it at the end later
+    btn_one.grid_forget()
+    btn_one.config(text= 'Next')
+    btn_one.config(command= next)
+
+    ##### second button
+    # change text: close -> back
+    # change command
+    # if clicked, we move back to the previous row
+    # for proper display, we forget it so that place it at the end later
+    btn_two.grid_forget()
+    btn_two.config(text= 'Back')
+    btn_two.config(command= back)
+
+    ##### pack the labels and entries
+    # main label
+    main_lbl.grid(row= row_inc, column= col_inc, pady= pad, columnspan=2)
+    row_inc += 1
+    # monthly charge
+    monthly_charge_lbl.grid(row= row_inc, column= col_inc, pady= pad)
+    monthly_charge_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
+    row_inc += 1
+    # additional charge
+    add_charge_lbl.grid(row= row_inc, column= col_inc, pady= pad)
+    add_charge_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
+    row_inc += 1
+    # notes on additional charges
+    add_charge_notes_lbl.grid(row= row_inc, column= col_inc, pady= pad)
+    add_charge_notes_entry .grid(row= row_inc, column= col_inc+1, padx= pad)
+    row_inc += 1
+    # my notes
+    my_notes_lbl.grid(row= row_inc, column= col_inc, pady= pad)
+    my_notes_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
+    row_inc += 1
+    # customer reminders
+    cust_reminder_lbl.grid(row= row_inc, column= col_inc, pady= pad)
+    cust_reminder_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
+    row_inc += 1
+    # check button
+    chk.grid(row= row_inc, column= col_inc, pady= pad)
+    row_inc += 1
+
+    ##### pack back in the next button, but not the back button just yet
+    # - turn the back button on at the second row
+    btn_one.grid(row= row_inc, column= col_inc, pady= pad)
+
+    # revert row increment
+    row_inc = 0
+
+    ##### update the display
+    update()
+    return
+
+##### update the gui display
+def update():
+    # global vars
+    global index
+    global error_str, error_lbl
+    global back_on, last_back, back_str
+    global btn_one,  btn_two
+    global var, chk
+    global main_lbl
+    global monthly_charge_lbl, monthly_charge_entry
+    global add_charge_lbl, add_charge_entry
+    global add_charge_notes_lbl, add_charge_notes_entry
+    global my_notes_lbl, my_notes_entry
+    global cust_reminder_lbl, cust_reminder_entry
+    global MONTH
+    global row_inc, col_inc
+
+    ##### clear the entries
+    monthly_charge_entry.delete(0, 'end')
+    add_charge_entry.delete(0, 'end')
+    add_charge_notes_entry.delete(0, 'end')
+    my_notes_entry.delete(0, 'end')
+    cust_reminder_entry.delete(0, 'end')
+    ##### reset checkbox
+    var.set(0) # value -> set it back to zero ie off
+    chk["fg"] = off_color # color -> set back to off color, not clicked
+
+    ##### error string and label logic
+    if error_str != '': # add in the error label and message
+        error_lbl.config(text= error_str)
+        error_lbl.grid(row= last_row+1, column= col_inc, pady = 0, columnspan=2)
+    else:
+        # remove the error lbl if present before
+        # if error was not present before, this does nothing
+        error_lbl.grid_forget()
+
+    ##### back button logic
+    # --------------------------------------------------------------------------
+    # add the 'back button' if index > 0; we don't want a back button for the
+    # first row becuase there is nothing to go back to; close the window to quit
+    if index == 1 and back_on == False:
+        # pack the back button
+        btn_two.grid(row= last_row, column= col_inc+1, padx= pad)
+        # update conditional that the 'back button' is on
+        back_on = True
+    # --------------------------------------------------------------------------
+    # remove back button if on index=0 i.e. we got back to the first row and
+    # need to remove the back button because there is nothing to go back to
+    if index == 0 and back_on == True:
+        btn_two.grid_forget() # remove button
+        back_on = False # update conditional
+    # --------------------------------------------------------------------------
+    # going back from the exit - last - screen
+    if last_back == True:
+        # we want to restore the main gui format
+        # -- i.e. the labels and entries followed by the buttons
+
+        ##### forget the buttons
+        btn_one.grid_forget()
+        btn_two.grid_forget()
+
+        ##### bring back the labels and entries
+        # increment row bc we do not forget the main label
+        row_inc += 1
+        # monthly charge
+        monthly_charge_lbl.grid(row= row_inc, column= col_inc, pady= pad)
+        monthly_charge_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
+        row_inc += 1
+        # additional charge
+        add_charge_lbl.grid(row= row_inc, column= col_inc, pady= pad)
+        add_charge_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
+        row_inc += 1
+        # additional charge notes
+        add_charge_notes_lbl.grid(row= row_inc, column= col_inc, pady= pad)
+        add_charge_notes_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
+        row_inc += 1
+        # my notes
+        my_notes_lbl.grid(row= row_inc, column= col_inc, pady= pad)
+        my_notes_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
+        row_inc += 1
+        # customer reminders
+        cust_reminder_lbl.grid(row= row_inc, column= col_inc, pady= pad)
+        cust_reminder_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
+        row_inc += 1
+        # check button
+        chk.grid(row= row_inc, column= col_inc, pady= pad)
+        row_inc += 1
+
+        ##### bring back the buttons
+        btn_one.grid(row= row_inc, column= col_inc, pady= pad)
+        btn_two.grid(row= row_inc, column= col_inc+1, padx= pad)
+        # reconfig the first button i.e. the begin button at start, close at end
+        btn_one.config(text= 'Next') # update text
+        btn_one.config(command= next) # update command
+
+        ###### update last_back conditional i.e. if we press the back button
+        # we are no longer on the end screen, coming back from the exit screen
+        last_back = False
+    ##### END ----------------------------------------------- back button logic
+
+    ##### update logic
+    # check if we can update
+    # if no more rows left, end
+    # if we can update, replace entries with appropriate text
+    if index > N-1:
+        end() # end screen logic
+    else:
+        # grab current line
+        curr_line = dict(tabl.iloc[index])
+
+        ##### input entries
+        ## main label text
+        text = ''
+        # inform user that we've come back to this row
+        if back_str != '':
+            text += back_str
+            # revert back string
+            back_str = ''
+        # main info
+        text += curr_line['FIRST']+' '+ curr_line['LAST'] + '\n\n' + \
+                curr_line['STREET_ADDRESS'] + '\n' + \
+                curr_line['CITY_ADDRESS']
+
+        ### ADD TEXT - conditional
+        # cond/filt reminders - worked out once when the table was loaded
+        text += remind_text[index]
+
+        ##### update the main label
+        # color
+        if dates_err[index]: # first indicator, red if any error
+            main_lbl.config(fg= 'red')
+        elif remind_text[index] != '': # if no error, then can set reminder
+            main_lbl.config(fg= reminder_color)
+        else: # revert to default, black color
+            main_lbl.config(fg= 'black')
+        # text
+        main_lbl.config(text=text)
+
+        ##### update entries
+        ## monthly charge entry
+        monthly_charge_entry.insert(0, format_amount(curr_line['MONTHLY_CHARGE']))
+        ## additional charge entry - set by a formula column or on an earlier pass
+        if curr_line['ADD_CHARGE'] != 0:
+            add_charge_entry.insert(0, format_amount(curr_line['ADD_CHARGE']))
+        add_charge_notes_entry.insert(0, curr_line['ADD_CHARGE_NOTES'])
+        ## my notes
+        my_notes_entry.insert(0, curr_line['MY_NOTES'])
+
+        return
+
+##### ending the program
+def end():
+    # global vars
+    global main_lbl
+    global btn_one
+    global monthly_charge_lbl, monthly_charge_entry
+    global add_charge_lbl, add_charge_entry
+    global add_charge_notes_lbl, add_charge_notes_entry
+    global my_notes_lbl, my_notes_entry
+    global cust_reminder_lbl, cust_reminder_entry
+    global chk
+    global last_back
+
+    ##### updating labels and buttons
+    ## update the text in the main label and its color
+    main_lbl.config(text= "You're done.")
+    main_lbl.config(fg= 'black')
+
+    ## update button one - originally the begin button then the next button
+    btn_one.config(text= 'Close') # update the text of the button
+    btn_one.config(command= close_root) # update the button's command
+    # no need to change affect of the back button
+
+    ##### forget the other labels and entries
+    # monthly charge
+    monthly_charge_lbl.grid_forget()
+    monthly_charge_entry.grid_forget()
+    # additonal charge
+    add_charge_lbl.grid_forget()
+    add_charge_entry.grid_forget()
+    # additional charge notes
+    add_charge_notes_lbl.grid_forget()
+    add_charge_notes_entry.grid_forget()
+    # my notes
+    my_notes_lbl.grid_forget()
+    my_notes_entry.grid_forget()
+    # customer reminder
+    cust_reminder_lbl.grid_forget()
+    cust_reminder_entry.grid_forget()
+    # check button
+    chk.grid_forget()
+
+    # going back from the end
+    last_back = True # update the indicator to restore main gui format
+    return
+
+##### next - go to the next row
+def next():
+    # global vars
+    global index, error_str, var
+    global monthly_charge_entry
+    global add_charge_entry, add_charge_notes_entry
+    global my_notes_entry, cust_reminder_entry
+
+    # grab and try reading in input
+    try:
+        # monthly charge input
+        monthly_in_amt_str = monthly_charge_entry.get().strip()
+        if monthly_in_amt_str == '':
+            monthly_in_amt_str = '0'
+        monthly_in_amt = eval_cents(monthly_in_amt_str)
+        # additional charge input
+        add_in_amt_str = add_charge_entry.get().strip()
+        if add_in_amt_str == '':
+            add_in_amt_str = '0'
+        add_in_amt = eval_cents(add_in_amt_str)
+        # additional charge notes input
+        in_add_charge_notes = str(add_charge_notes_entry.get().strip())
+        # my_notes
+        in_my_notes = str(my_notes_entry.get().strip())
+        # cust_reminder
+        in_cust_reminder = str(cust_reminder_entry.get().strip())
+
+        # update data
+        # - checkbox: do not include if clicked
+        commit(index, monthly_in_amt, add_in_amt,
+               in_add_charge_notes, in_my_notes, in_cust_reminder,
+               var.get() != 1)
+
+        ##### clear the error string
+        # ie we have not run into an error at this point
+        error_str = ''
+
+        ##### update index -- bc we have no error
+        index += 1
+
+    # reached an error
+    except CalcError as err:
+        # we have an error, so update error string
+        # and do not move forward with index
+        error_str = '\n\n' + \
+        'Previous error. Make sure amounts are valid real numbers (%s).' % err
+
+    ##### update
+    # -- if we had no error, we update to the next row
+    # -- if we had an error, we re-update the current row with an error message
+    update()
+    return
+
+##### next - go to the next row
+def back():
+    # global vars
+    global index, back_str, error_str
+
+    # revert index
+    index -= 1
+
+    # make sure we revert the included ariable indicator just in case
+    included[index] = 1
+
+    # update back string
+    back_str = 'WENT BACK - '
+
+    # update error string - in case we were at an error
+    error_str = ''
+
+    # we went back, so now update the main gui display
+    update()
+    return
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# SET-UP the gui
+
+##### build the gui and run the session
+# - returns True if the operator went through every row and closed the window
+# - start_time (time.perf_counter) is used to report the time to first window
+# - reminders is the cond/filt status of every row (see build_reminders)
+# - write_files: optional write(listener, cancel) run with a progress view when
+#   the operator closes the session; an exception it raised is raised again
+#   once the window is closed
+def run_session(table, incl, month, year, reminders, commit_row, start_time=None,
+                write_files=None):
+    # global vars
+    global tabl, included, N, MONTH, YEAR, commit, write, write_error
+    global remind_text, dates_err
+    global root, main_lbl, error_lbl
+    global btn_one, btn_two
+    global monthly_charge_lbl, monthly_charge_entry
+    global add_charge_lbl, add_charge_entry
+    global add_charge_notes_lbl, add_charge_notes_entry
+    global my_notes_lbl, my_notes_entry
+    global cust_reminder_lbl, cust_reminder_entry
+    global var, chk
+    global index, back_on, last_back, error_str, back_str, final_end
+
+    ##### session data
+    tabl = table
+    included = incl
+    N = tabl.shape[0]
+    MONTH = month
+    YEAR = year
+    remind_text = reminders['TEXT'].tolist()
+    dates_err = reminders['DATES_ERR'].tolist()
+    commit = commit_row
+    write = write_files
+    write_error = None
+    # start at the first row
+    index = 0
+    back_on = False
+    last_back = False
+    error_str = ''
+    back_str = ''
+    final_end = False
+
+    ##### root for gui
+    root = tk.Tk()
+    root.title('Invoice: '+MONTH+' '+YEAR)
+    #root.configure(background='grey')
+
+    ##### center the window
+    center_window(root, width, height)
+
+    ###### main label where we will show input
+    main_lbl = tk.Label(root, text= 'Click to begin.')
+    main_lbl.config(font= (font, size, bold_ind))
+    main_lbl.config(fg= 'black')
+
+    main_lbl.grid(row=0, column=0, pady=pad, columnspan=2)
+
+    ##### error label
+    error_lbl = tk.Label(root, text= error_str)
+    error_lbl.config(font= (font, size, bold_ind))
+    error_lbl.config(fg= 'red')
+
+    ##### the button to begin -> next -> end program
+    btn_one = tk.Button(root, text= 'Begin', command= begin,
+                    highlightbackground= col1,
+                    highlightthickness= thick)
+    btn_one.config(font= (font, size, bold_ind))
+    btn_one.grid(row=1, column=0, pady=pad)
+
+    ##### the button to close -> back
+    btn_two = tk.Button(root, text= 'Close', command= close_root,
+                        highlightbackground= col2,
+                        highlightthickness= thick)
+    btn_two.config(font= (font, size, bold_ind))
+    btn_two.grid(row=1, column=1, pady=pad)
+
+    ##### monthly charge
+    ## label
+    monthly_charge_lbl = tk.Label(root, text= 'Monthly Charge:')
+    monthly_charge_lbl.config(font= (font, size, bold_ind))
+    monthly_charge_lbl.config(fg= amt_color)
+    ## entry
+    monthly_charge_entry = tk.Entry(root, width= entry_width)
+    monthly_charge_entry.config(font= (font, size))
+
+    ##### additional charge
+    ## label
+    add_charge_lbl = tk.Label(root, text= 'Additional Charge:')
+    add_charge_lbl.config(font= (font, size, bold_ind))
+    add_charge_lbl.config(fg= add_color)
+    ## entry
+    add_charge_entry = tk.Entry(root, width= entry_width)
+    add_charge_entry.config(font= (font, size))
+
+    ##### additional charge notes
+    ## label
+    add_charge_notes_lbl = tk.Label(root, text= 'Notes on additional charge:')
+    add_charge_notes_lbl.config(font= (font, size, bold_ind))
+    add_charge_notes_lbl.config(fg= add_color)
+    ## entry
+    add_charge_notes_entry = tk.Entry(root, width= entry_width)
+    add_charge_notes_entry.config(font= (font, size))
+
+    ##### my notes
+    ## label
+    my_notes_lbl = tk.Label(root, text= 'My notes:')
+    my_notes_lbl.config(font= (font, size, bold_ind))
+    my_notes_lbl.config(fg= notes_color)
+    ## entry
+    my_notes_entry = tk.Entry(root, width= entry_width)
+    my_notes_entry.config(font= (font, size))
+
+    ##### reminders
+    ## label
+    cust_reminder_lbl = tk.Label(root, text= 'Set Customer Reminder:')
+    cust_reminder_lbl.config(font= (font, size, bold_ind))
+    cust_reminder_lbl.config(fg= cust_remind_color)
+    ## entry
+    cust_reminder_entry = tk.Entry(root, width= entry_width)
+    cust_reminder_entry.config(font= (font, size))
+
+    ##### include check button
+    var = tk.IntVar()
+    chk = tk.Checkbutton(root, text='Do Not Include?', variable=var,
+                selectcolor= 'blue', command= on_check, fg= off_color)
+    chk.config(font= (font, size, bold_ind))
+    # var.get()
+
+    ##### time to first window
+    if start_time is not None:
+        root.after_idle(lambda: print('Window shown after %.2f s.' % \
+                                      (time.perf_counter() - start_time)))
+
+    ##### main loop
+    root.mainloop()
+    if write_error is not None:
+        raise write_error
+    return final_end
@@ -0,0 +1,261 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# timing and progress of an invoice.py run
+# - stage timers, render latencies per template and bytes written are kept in
+#   run_stats and written out as the run report
+# - INVOICE_PROFILE=cprofile or tracemalloc (or --profile) profiles one run
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+# LIBRARIES
+
+import os
+import sys
+import json
+import time
+import datetime
+from contextlib import contextmanager
+
+import numpy as np
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# RUN STATS
+
+##### everything measured during the run
+# - stages: stage name -> seconds, in the order the stages ran
+# - renders: template file -> seconds of each rendered doc
+# - reused: template file -> docs taken from the render cache
+# - bytes_written: kind of output -> bytes
+run_stats = {}
+
+##### start measuring a new run
+def reset_stats():
+    run_stats.clear()
+    run_stats['started'] = datetime.datetime.now().isoformat(timespec='seconds')
+    run_stats['stages'] = {}
+    run_stats['renders'] = {}
+    run_stats['reused'] = {}
+    run_stats['bytes_written'] = {}
+    return
+
+reset_stats()
+
+##### time a stage, a stage can be timed in several pieces
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter()-start)
+
+##### add seconds to a stage timed by hand
+def record_stage(name, seconds):
+    stages = run_stats['stages']
+    stages[name] = stages.get(name, 0.0) + seconds
+    return
+
+##### items of an iterable, the time spent waiting for them counted as a stage
+def timed_iter(name, iterable):
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+##### a rendered doc: seconds it took, None if it came from the render cache
+def record_render(temp_path, seconds):
+    name = os.path.basename(temp_path)
+    if seconds is None:
+        run_stats['reused'][name] = run_stats['reused'].get(name, 0) + 1
+    else:
+        run_stats['renders'].setdefault(name, []).append(seconds)
+    return
+
+##### bytes of an output file
+def record_bytes(kind, n_bytes):
+    written = run_stats['bytes_written']
+    written[kind] = written.get(kind, 0) + n_bytes
+    return
+
+##### run report: plain dict, ready for json
+def run_report(extra=None):
+    report = {'started': run_stats['started'],
+              'finished': datetime.datetime.now().isoformat(timespec='seconds'),
+              'stages': {name: round(secs, 4) for name, secs in run_stats['stages'].items()},
+              'bytes_written': dict(run_stats['bytes_written']),
+              'templates': {}}
+    names = sorted(set(run_stats['renders']) | set(run_stats['reused']))
+    for name in names:
+        secs = np.array(run_stats['renders'].get(name, []), dtype=float)
+        entry = {'rendered': int(secs.size),
+                 'reused': run_stats['reused'].get(name, 0)}
+        if secs.size > 0:
+            entry['p50_ms'] = round(float(np.percentile(secs, 50))*1000, 2)
+            entry['p95_ms'] = round(float(np.percentile(secs, 95))*1000, 2)
+        report['templates'][name] = entry
+    if extra is not None:
+        report.update(extra)
+    return report
+
+##### write the run report
+def save_report(path, extra=None):
+    with open(path, 'w') as f:
+        json.dump(run_report(extra), f, indent=1)
+    return
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# PROGRESS
+
+##### live progress line: done/total, rate and time left
+# - on a terminal the line is redrawn in place, otherwise a line is printed
+#   every tenth of the way
+# - listener: optional function given the status after every item, e.g. to
+#   show it in the gui
+class Progress:
+    def __init__(self, total, label='Writing', stream=None, interval=0.25,
+                 listener=None):
+        self.total = total
+        self.label = label
+        self.stream = sys.stdout if stream is None else stream
+        self.interval = interval
+        self.listener = listener
+        self.live = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self.start = time.perf_counter()
+        self.last_shown = 0.0
+        self.last_tenth = 0
+        self.done = 0
+        self.item = None # last item done, e.g. the client
+
+    # plain dict: label, done, total, rate (per s), eta (s or None), item
+    def status(self):
+        elapsed = time.perf_counter()-self.start
+        rate = self.done/elapsed if elapsed > 0 else 0.0
+        eta = None
+        if rate > 0 and self.done < self.total:
+            eta = (self.total-self.done)/rate
+        return {'label': self.label, 'done': self.done, 'total': self.total,
+                'rate': rate, 'eta': eta, 'item': self.item}
+
+    def line(self):
+        status = self.status()
+        text = '%s: %d/%d  %.1f/s' % (self.label, self.done, self.total, status['rate'])
+        if status['eta'] is not None:
+            text += '  ETA %s' % format_eta(status['eta'])
+        return text
+
+    # one more item done
+    def update(self, n=1, item=None):
+        self.done += n
+        self.item = item
+        if self.listener is not None:
+            self.listener(self.status())
+        if self.live:
+            now = time.perf_counter()
+            if now-self.last_shown >= self.interval or self.done == self.total:
+                self.stream.write('\r'+self.line()+'   ')
+                self.stream.flush()
+                self.last_shown = now
+        elif self.total > 0:
+            tenth = self.done*10 // self.total
+            if tenth > self.last_tenth:
+                self.last_tenth = tenth
+                self.stream.write(self.line()+'\n')
+        return
+
+    def finish(self):
+        if self.live and self.total > 0:
+            self.stream.write('\n')
+        return
+
+##### m:ss of a number of seconds
+def format_eta(seconds):
+    left = int(seconds)
+    return '%d:%02d' % (left // 60, left % 60)
+
+##### tell a progress listener about a step without items, e.g. a save
+def announce(listener, label):
+    if listener is not None:
+        listener({'label': label, 'done': None, 'total': None,
+                  'rate': None, 'eta': None, 'item': None})
+    return
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# PROFILING
+# only the main process is profiled, render workers are not
+# -- cprofile only sees the thread that enabled it, so threads that do the
+# -- run's work (the gui write phase, the prerenderer) run under run_profiled,
+# -- which gives them a profiler of their own merged in at stop_profile;
+# -- other threads are not profiled. tracemalloc covers every thread
+
+profile_kinds = ['cprofile', 'tracemalloc']
+
+##### the running profile, as returned by start_profile
+active_profile = None
+##### cprofile profilers of the threads that ran under run_profiled
+thread_profiles = []
+
+##### start profiling -> profiler to hand to stop_profile
+def start_profile(kind):
+    global active_profile
+    if kind == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        active_profile = (kind, profiler)
+        return active_profile
+    if kind == 'tracemalloc':
+        import tracemalloc
+        tracemalloc.start(25)
+        active_profile = (kind, None)
+        return active_profile
+    return None
+
+##### fn(*args) on this thread, profiled if a cprofile run is going
+def run_profiled(fn, *args):
+    if active_profile is None or active_profile[0] != 'cprofile':
+        return fn(*args)
+    import cProfile
+    prof = cProfile.Profile()
+    thread_profiles.append(prof)
+    prof.enable()
+    try:
+        return fn(*args)
+    finally:
+        prof.disable()
+
+##### stop profiling and write the result into out_dir -> file written
+def stop_profile(profiler, out_dir='.'):
+    global active_profile
+    if profiler is None:
+        return None
+    active_profile = None
+    kind, prof = profiler
+    if kind == 'cprofile':
+        import pstats
+        prof.disable()
+        out_path = os.path.join(out_dir, 'profile.pstats')
+        stats = pstats.Stats(prof)
+        for thread_prof in thread_profiles:
+            stats.add(thread_prof)
+        del thread_profiles[:]
+        stats.dump_stats(out_path)
+        return out_path
+    import tracemalloc
+    snapshot = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    out_path = os.path.join(out_dir, 'tracemalloc.snapshot')
+    snapshot.dump(out_path)
+    # top allocations next to it, readable without loading the snapshot
+    with open(os.path.join(out_dir, 'tracemalloc_top.txt'), 'w') as f:
+        f.write('peak traced memory: %.1f MB\n' % (peak/1024/1024))
+        for stat in snapshot.statistics('lineno')[:30]:
+            f.write(str(stat)+'\n')
+    return out_path
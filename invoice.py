@@ -1,80 +1,62 @@
 # ------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------
 # example use: python code/invoice.py September 2019
+#
+# the module can also be imported and driven stage by stage:
+#   paths = template_paths()          # template and data file paths
+#   tabl = load_table(paths['invoice_data_template'])
+#   included = np.ones(tabl.shape[0], dtype=int)
+#   dirs = make_directories('September', '2019')
+#   write_outputs(tabl, included, 'September', '2019', paths, dirs)
 # ------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------
 
 # LIBRARIES
+# - the word libraries (docxtpl, jinja2, lxml, python-docx, docxcompose) are
+#   only imported by the write phase, see warm_imports
+
+import time
+START_TIME = time.perf_counter() # for the time to the first window
 
-import tkinter as tk
 import numpy as np
 import pandas as pd
 import os
+import io
+import json
+import hashlib
+import threading
+import queue
+from concurrent.futures import ProcessPoolExecutor
 
-from docxtpl import DocxTemplate
-from docx import Document
 import datetime
-from docxcompose.composer import Composer
-from sys import argv
+import argparse
+
+import instrument
+from instrument import stage, timed_iter, record_bytes, Progress, announce
+from money import money_cols, to_cents, to_dollars, format_money
+from calc import CalcError, eval_array, eval_cents
+import money
 
 # ------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------
-# COMMAND LINE INPUTS
+# CONSTANTS
 
-# check command line args for month and year of invoice
-if len(argv) > 2:
-    MONTH = argv[1] # first argument is the month
-    YEAR = argv[2] # second argument is the year
-else:
-    exit('Missing MONTH and/or YEAR argument.')
+##### problem with the inputs - main() exits with the message
+class InvoiceError(Exception):
+    pass
+
+##### the operator cancelled the write phase
+class WriteCancelled(InvoiceError):
+    pass
 
 # month set
 month_set = set(['January', 'February', 'March', 'April', 'May', 'June', 'July',
               'August', 'September', 'October', 'November', 'December'])
-# check for proper month
-if MONTH not in month_set:
-    exit('Provide a proper month.')
-
-# try for proper dates
-try:
-    CURR_DATE = datetime.datetime.strptime(MONTH+' ' + YEAR, '%B %Y')
-except ValueError: # else exit
-    str_exit =  'Improper command line inputs.\n'
-    str_exit += 'Proper input looks like:\n'
-    str_exit += 'python code/invoice.py September 2019'
-    exit(str_exit)
-
-### needed template files
-# docs
-fpage = 'templates/fpage.docx' # first page
-invoice_template = 'templates/invoice_template.docx'
-invoice_template_mult = 'templates/invoice_template_mult.docx' #goes with RPind
-invoice_template_z = 'templates/invoice_template_z.docx' #goes with Zind
-invoice_template_z_gg = 'templates/invoice_template_z.docx' #goes with Zind/ gg
-invoice_template_v = 'templates/invoice_template_v.docx' #goes with Vind
-
-# data
-invoice_data_template = 'templates/invoice_data_template.xlsx'
-
-# check for needed files
-if not os.path.exists(fpage): # fpage template
-    exit('Missing fpage template.')
-if not os.path.exists(invoice_template): # word template
-    exit('Missing invoice word template.')
-if not os.path.exists(invoice_template_mult): # word template mult
-    exit('Missing invoice word template mult.')
-if not os.path.exists(invoice_template_z): # word template z
-    exit('Missing invoice word template z.')
-if not os.path.exists(invoice_template_z_gg): # word template z_gg
-    exit('Missing invoice word template z_gg.')
-if not os.path.exists(invoice_template_v): # word template v
-    exit('Missing invoice word template v.')
-if not os.path.exists(invoice_data_template): # data template
-    exit('Missing invoice data template.')
 
-# ------------------------------------------------------------------------------
-# ------------------------------------------------------------------------------
-# IMPORT and AUGMENT DATA
+### month dict: month name -> numerical two digit code
+month_dict = {'January':'01', 'February':'02', 'March':'03', 'April':'04',
+                'May':'05', 'June':'06', 'July':'07', 'August':'08',
+                'September':'09', 'October':'10', 'November':'11', 'December':'12'}
 
 # column list
 col_list = ['OWNER', 'DIRECTION', 'FIRST', 'LAST',
@@ -87,6 +69,7 @@ col_list = ['OWNER', 'DIRECTION', 'FIRST', 'LAST',
             'RP_INDICATOR',
             'Z_INDICATOR', 'V_INDICATOR']
 # data type dictionary
+# - the money columns are read as dollars and kept as int64 cents (see money.py)
 types = {'OWNER':str, 'DIRECTION':str, 'FIRST':str, 'LAST':str,
         'STREET_ADDRESS':str, 'CITY_ADDRESS':str,
         'MY_NOTES':str,
@@ -96,924 +79,1508 @@ types = {'OWNER':str, 'DIRECTION':str, 'FIRST':str, 'LAST':str,
         'COND_MONTHS':str, 'FILT_MONTHS':str,
         'RP_INDICATOR':int,
         'Z_INDICATOR':int, 'V_INDICATOR':int}
-
-# read in data
-tabl = pd.read_excel(invoice_data_template,
-                     usecols= col_list,
-                     dtype=types,
-                     skiprows=0)
-# fix email improper reading in of NA string values in emails
-tabl['EMAIL_ADDRESS'] = tabl['EMAIL_ADDRESS'].astype(str) #'NA' is converted to string 'nan'
-# fill in any missing data for string variables
-# fill in with a blank ''
+# string columns where missing data is filled in with a blank ''
 na_list = ['FIRST', 'LAST', 'STREET_ADDRESS', 'CITY_ADDRESS', 'MY_NOTES']
-for col in na_list:
-    tabl[col].fillna(value='', inplace=True)
+# optional columns, blank when the workbook does not have them
+# - GROUP: rows with the same key share one invoice (see INVOICE GROUPS)
+opt_col_list = ['GROUP']
+opt_types = {'GROUP':str}
+# optional formula columns, e.g. MONTHLY_CHARGE_FORMULA = '=MONTHLY_CHARGE*1.05'
+# - a formula sets its charge on the rows where it is not blank (see FORMULAS)
+formula_targets = ['MONTHLY_CHARGE', 'ADD_CHARGE', 'COND_CHARGE', 'FILT_CHARGE']
+formula_cols = [col+'_FORMULA' for col in formula_targets]
+formula_types = {col:str for col in formula_cols}
 
-# number of rows
-N = tabl.shape[0]
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# INPUTS
+
+### needed template files
+def template_paths(template_dir='templates'):
+    return {
+        # docs
+        'fpage': template_dir+'/fpage.docx', # first page
+        'invoice_template': template_dir+'/invoice_template.docx',
+        'invoice_template_mult': template_dir+'/invoice_template_mult.docx', #goes with RPind
+        'invoice_template_z': template_dir+'/invoice_template_z.docx', #goes with Zind
+        'invoice_template_z_gg': template_dir+'/invoice_template_z.docx', #goes with Zind/ gg
+        'invoice_template_v': template_dir+'/invoice_template_v.docx', #goes with Vind
+        # data
+        'invoice_data_template': template_dir+'/invoice_data_template.xlsx'}
 
-# add new columns
-tabl['ADD_CHARGE'] = np.zeros(N, dtype=float)
-tabl['ADD_CHARGE_NOTES'] = ['']*N
-tabl['CUST_REMINDER'] = ['']*N
+# check for needed files
+def check_files(paths):
+    if not os.path.exists(paths['fpage']): # fpage template
+        raise InvoiceError('Missing fpage template.')
+    if not os.path.exists(paths['invoice_template']): # word template
+        raise InvoiceError('Missing invoice word template.')
+    if not os.path.exists(paths['invoice_template_mult']): # word template mult
+        raise InvoiceError('Missing invoice word template mult.')
+    if not os.path.exists(paths['invoice_template_z']): # word template z
+        raise InvoiceError('Missing invoice word template z.')
+    if not os.path.exists(paths['invoice_template_z_gg']): # word template z_gg
+        raise InvoiceError('Missing invoice word template z_gg.')
+    if not os.path.exists(paths['invoice_template_v']): # word template v
+        raise InvoiceError('Missing invoice word template v.')
+    if not os.path.exists(paths['invoice_data_template']): # data template
+        raise InvoiceError('Missing invoice data template.')
+    return
 
-# indicator for whether to include rows or not for the outgoing files
-included = np.ones(N, dtype=int)
+# check the month and year of the invoice
+def invoice_date(month, year):
+    # check for proper month
+    if month not in month_set:
+        raise InvoiceError('Provide a proper month.')
+
+    # try for proper dates
+    try:
+        return datetime.datetime.strptime(month+' ' + year, '%B %Y')
+    except ValueError: # else exit
+        str_exit =  'Improper command line inputs.\n'
+        str_exit += 'Proper input looks like:\n'
+        str_exit += 'python code/invoice.py September 2019'
+        raise InvoiceError(str_exit)
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# IMPORT and AUGMENT DATA
+
+##### read in the client table
+# the cleaned table is kept in a pickle next to the workbook and reused until
+# the workbook changes, parsing the xlsx is the slow part of starting up
+# -- the snapshot is keyed on the workbook path, mtime and size and on
+# -- table_version, bump it when the cleaning below changes
+# -- the table is held whole in every mode, --batch and --from/--to too: the
+# -- groups, the adjustments, the totals and the manifest work on whole
+# -- columns, and reading the workbook loads it whole. What is bounded is the
+# -- render window (see RENDER CONTEXTS and render_jobs), the paper masters
+# -- (see write_invoices) and the spreadsheet rows (see write_rows), so memory
+# -- grows with the table's columns, not with the rendered docs
+table_version = '5'
+
+def load_table(data_path):
+    snapshot_path = data_path+'.cache.pkl'
+    stat = os.stat(data_path)
+    key = (table_version, os.path.abspath(data_path), stat.st_mtime_ns, stat.st_size)
+    try:
+        snapshot = pd.read_pickle(snapshot_path)
+        if snapshot['key'] == key:
+            return snapshot['tabl']
+    except Exception:
+        pass # missing or unreadable, read the workbook
+
+    tabl = read_table(data_path)
+
+    # save the snapshot for the next run, a failed write only costs speed
+    tmp_path = snapshot_path+'.tmp'
+    try:
+        pd.to_pickle({'key': key, 'tabl': tabl}, tmp_path)
+        os.replace(tmp_path, snapshot_path)
+    except OSError:
+        pass
+    return tabl
+
+##### read in and clean the client table from the workbook
+def read_table(data_path):
+    # read in data
+    tabl = pd.read_excel(data_path,
+                         usecols= lambda col: col in col_list or col in opt_col_list
+                                              or col in formula_cols,
+                         dtype=dict(types, **opt_types, **formula_types),
+                         skiprows=0)
+    missing = [col for col in col_list if col not in tabl.columns]
+    if len(missing) > 0:
+        raise InvoiceError('Data template is missing columns: ' + ', '.join(missing))
+    # fix email improper reading in of NA string values in emails
+    tabl['EMAIL_ADDRESS'] = tabl['EMAIL_ADDRESS'].astype(str) #'NA' is converted to string 'nan'
+    # fill in any missing data for string variables
+    # fill in with a blank ''
+    for col in na_list:
+        tabl[col] = tabl[col].fillna(value='')
+    for col in opt_col_list:
+        if col not in tabl.columns:
+            tabl[col] = ['']*tabl.shape[0]
+        tabl[col] = tabl[col].fillna(value='')
+    # money in cents, a blank amount is no charge
+    for col in money_cols:
+        if col in tabl.columns:
+            tabl[col] = to_cents(tabl[col])
+
+    # number of rows
+    N = tabl.shape[0]
+
+    # add new columns
+    tabl['ADD_CHARGE'] = np.zeros(N, dtype=np.int64)
+    tabl['ADD_CHARGE_NOTES'] = ['']*N
+    tabl['CUST_REMINDER'] = ['']*N
+
+    # charges given by formula columns
+    apply_formulas(tabl)
+    return tabl
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# FORMULAS
+# a formula column works out its charge from the other columns of the row, see
+# calc.py for what a formula may hold
+# -- the leading '=' is optional, in excel type the formula as text
+# -- formulas see the columns as read (money in dollars), not each other's results
+# -- each distinct formula is parsed and evaluated once, over all of its rows
+
+##### set the charges of the formula columns and drop them
+def apply_formulas(tabl):
+    present = [col for col in formula_cols if col in tabl.columns]
+    if len(present) == 0:
+        return
+    # numeric columns as read, money in dollars
+    columns = {}
+    for col in tabl.columns:
+        if col in money_cols:
+            columns[col] = to_dollars(tabl[col])
+        elif col not in present and pd.api.types.is_numeric_dtype(tabl[col]):
+            columns[col] = tabl[col].to_numpy(dtype=float)
+    results = {}
+    for col in present:
+        target = col[:-len('_FORMULA')]
+        texts = tabl[col].fillna('').astype(str).str.strip().str.lstrip('=').str.strip()
+        codes, uniques = pd.factorize(texts)
+        values = tabl[target].to_numpy(dtype=np.int64).copy()
+        for k, text in enumerate(uniques):
+            if text == '':
+                continue
+            rows = np.flatnonzero(codes == k)
+            try:
+                dollars = eval_array(text, {name: vals[rows] for name, vals in columns.items()},
+                                     len(rows))
+            except CalcError as err:
+                # workbook row: 1-based with the header on row 1
+                raise InvoiceError('%s on workbook row %d: %s.' % (col, rows[0]+2, err))
+            values[rows] = to_cents(dollars)
+        results[target] = values
+    for target in results:
+        tabl[target] = results[target]
+    tabl.drop(present, axis=1, inplace=True)
+    return
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# COND/FILT REMINDERS
+# the cond... and filt... months of every client are parsed once at load into
+# a month bitmask, and the reminder shown for the invoice month is kept with it
+# -- bit k is set for the (k+1)th month, e.g. January -> 1, March -> 4
+# -- 'exclude' -> 0, improper months -> -1, a blank cell is improper too
+
+### month bit: month name -> bit of the month in a bitmask
+month_bit = {m: 1 << (int(month_dict[m])-1) for m in month_dict}
+
+##### bitmask of a cond... or filt... months string
+def month_mask(months_str):
+    if months_str == 'exclude':
+        return 0
+    pot_months = set("".join(months_str.split(',')).split())
+    ## - improper months, or none at all
+    if len(pot_months) == 0 or len(pot_months - month_set) != 0:
+        return -1
+    ## - proper months
+    mask = 0
+    for m in pot_months:
+        mask |= month_bit[m]
+    return mask
+
+##### bitmasks for a column - each distinct string is parsed once
+def month_masks(col):
+    # blank cells are NaN, kept as NaN by astype(str) with pandas' str dtype
+    col = col.fillna('').astype(str)
+    masks = {months_str: month_mask(months_str) for months_str in col.unique()}
+    return col.map(masks).to_numpy(dtype=np.int64)
+
+##### reminder status of every client for the invoice month
+# - COND_MASK, FILT_MASK: month bitmasks
+# - COND_DUE, FILT_DUE: time to charge for cond... / filt... this month
+# - DATES_ERR: improper cond... or filt... months
+# - TEXT: reminder and error text shown with the client in the gui
+def build_reminders(tabl, month):
+    cond_mask = month_masks(tabl['COND_MONTHS'])
+    filt_mask = month_masks(tabl['FILT_MONTHS'])
+    bit = month_bit[month]
+    cond_err = cond_mask == -1
+    filt_err = filt_mask == -1
+    cond_due = ~cond_err & ((cond_mask & bit) != 0)
+    filt_due = ~filt_err & ((filt_mask & bit) != 0)
+
+    ##### text - only rows with something to say need any work
+    text = np.full(tabl.shape[0], '', dtype=object)
+    cond_charge = format_money(tabl['COND_CHARGE'])
+    filt_charge = format_money(tabl['FILT_CHARGE'])
+    for k in np.flatnonzero(cond_err | filt_err | cond_due | filt_due):
+        row_text = ''
+        ## cond
+        if cond_due[k]:
+            row_text += '\n\n' + "Remember, it's time to charge for cond...." + \
+                        ' - ' + cond_charge[k]
+        elif cond_err[k]:
+            row_text += '\n\n' + "Error, improper cond... month"
+        ## filt - double or single new line
+        sep = '\n' if row_text != '' else '\n\n'
+        if filt_due[k]:
+            row_text += sep + "Remember, it's time to charge for filt...." + \
+                        ' - ' + filt_charge[k]
+        elif filt_err[k]:
+            row_text += sep + "Error, improper filt... month"
+        text[k] = row_text
+
+    return pd.DataFrame({'COND_MASK': cond_mask, 'FILT_MASK': filt_mask,
+                         'COND_DUE': cond_due, 'FILT_DUE': filt_due,
+                         'DATES_ERR': cond_err | filt_err,
+                         'TEXT': text}, index=tabl.index)
+
+##### print the clients due for a cond... or filt... charge this month
+def report_reminders(tabl, reminders, month):
+    due = reminders['COND_DUE'] | reminders['FILT_DUE'] | reminders['DATES_ERR']
+    if not due.any():
+        return
+    print('Cond.../filt... reminders for ' + month + ':')
+    for k in np.flatnonzero(due.to_numpy()):
+        name = (tabl['FIRST'].iat[k] + ' ' + tabl['LAST'].iat[k]).strip()
+        notes = [line for line in reminders['TEXT'].iat[k].split('\n') if line != '']
+        print('  ' + name + ': ' + '; '.join(notes))
+    return
 
 # ------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------
 ## CREATE DIRECTORY
-print("Creating directories...")
 
-### month dict: month name -> numerical two digit code
-month_dict = {'January':'01', 'February':'02', 'March':'03', 'April':'04',
-                'May':'05', 'June':'06', 'July':'07', 'August':'08',
-                'September':'09', 'October':'10', 'November':'11', 'December':'12'}
+##### make the month directories
+def make_directories(month, year, out_root='invoices'):
+    print("Creating directories...")
+
+    # make directory
+    # example: invoices/2019_09_September
+    # this allows invoices to be properly sorted numerically
+    # -- e.g. 2019_08_August is on top of 2019_09_September
+    # -- and 2018_12_December is on top of 2019_01_January
+    # -- and 2018_09_September is above 2019_09_September
+    path = out_root+'/'+year+'_'+month_dict[month]+'_'+month
+    dirs = {'path': path}
+    ##### sub directories
+    ##### example: invoices/2019_09_September/PP and invoices/2019_09_September/GG
+    dirs['sub_path_pp'] = path+'/PP'
+    dirs['sub_path_gg'] = path+'/GG'
+    ##### "emails" directories
+    dirs['emails_path_pp'] = dirs['sub_path_pp']+'/emails'
+    dirs['emails_path_gg'] = dirs['sub_path_gg']+'/emails'
+
+    # a month that was already run is updated in place (see MANIFEST)
+    for key in ['path', 'sub_path_pp', 'sub_path_gg',
+                'emails_path_pp', 'emails_path_gg']:
+        try:
+            os.makedirs(dirs[key], exist_ok=True)
+        except OSError:
+            raise InvoiceError("Creation of the directory %s failed" % dirs[key])
+
+    print("Directories created.")
+    return dirs
 
-# make directory
-# example: invoices/2019_09_September
-# this allows invoices to be properly sorted numerically
-# -- e.g. 2019_08_August is on top of 2019_09_September
-# -- and 2018_12_December is on top of 2019_01_January
-# -- and 2018_09_September is above 2019_09_September
-path = 'invoices/'+YEAR+'_'+month_dict[MONTH]+'_'+MONTH
-try:
-    os.mkdir(path)
-except OSError:
-    exit("Creation of the directory %s failed" % path)
-
-##### sub directories
-##### example: invoices/2019_09_September/PP and invoices/2019_09_September/GG
-## pp
-sub_path_pp = path+'/PP'
-try:
-    os.mkdir(sub_path_pp)
-except OSError:
-    exit("Creation of the directory %s failed" % sub_path_pp)
-## gg
-sub_path_gg = path+'/GG'
-try:
-    os.mkdir(sub_path_gg)
-except OSError:
-    exit("Creation of the directory %s failed" % sub_path_gg)
-
-##### make "emails" directories
-## pp
-emails_path_pp = sub_path_pp+'/emails'
-try:
-    os.mkdir(emails_path_pp)
-except OSError:
-    exit("Creation of the directory %s failed" % emails_path_pp)
-## gg
-emails_path_gg = sub_path_gg+'/emails'
-try:
-    os.mkdir(emails_path_gg)
-except OSError:
-    exit("Creation of the directory %s failed" % emails_path_gg)
-
-print("Directories created.")
-
-
-
-# ------------------------------------------------------------------------------
-# ------------------------------------------------------------------------------
-# GLOBAL VARS and CONSTANTS
-
-##### global vars
-# current row
-index = 0
-# indicator for whether or not the 'back button' is on in the gui
-back_on = False
-# indicator for restoring the main gui format upon going back to the main...
-# ...program from the exit screen gui format
-last_back = False
-# error string to attach if we receive improper input
-error_str = ''
-# back string to infrom user we went back a row
-back_str = ''
-# indicator for whether we have finished the main invoicing program
-final_end = False
-# dates error indicator
-dates_err_ind = False
-# reminder notice indicator
-remind_ind = False
-# row counter, column counter
-row_inc = 0
-col_inc = 0
-##### last tow of the gui format
-# main->0; month charge->1; add charge->2; notes add char->3; notes->4;
-# cust remind->5; check->6; button one->7; button two->7
-last_row = 7
-
-##### constants for tkinter display windows
-font = 'Times' # font type
-bold_ind = 'bold' # bold indicator
-size = 18 # font size
-col1 = '#14bcfe' #color-> blue-ish
-col2 = '#fe9114' #color -> orange-ish
-notes_color = 'black' # notes color
-reminder_color = 'purple' ## '#cf2b29';'#e34240'; red-ish
-amt_color = 'green' # amount color
-add_color = '#0a4cbf' # #blue-ish
-cust_remind_color = 'red' # cust reminder color
-thick = 2 # highlighted thickness
-pad = 6 # amount of padding
-width = 1000 # width dim -> of the entire window
-height = 800 # height dim -> of the entire window
-entry_width = 80 # width dim of the user input sections
-on_color = 'red' # color of checked button when on
-off_color = 'grey' # color of checked button when off
-
-# ------------------------------------------------------------------------------
-# ------------------------------------------------------------------------------
-# WINDOW FUNCTIONS
-
-##### center the window upon opening with a given width and height
-def center_window(base, width=300, height=200):
-    # get screen width and height
-    screen_width = base.winfo_screenwidth()
-    screen_height = base.winfo_screenheight()
-    # calculate position x and y coordinates
-    x = (screen_width/2) - (width/2)
-    y = (screen_height/2) - (height/2)
-    base.geometry('%dx%d+%d+%d' % (width, height, x, y))
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# MANIFEST
+# manifest.json in the month directory records every output file with a hash of
+# the inputs it was built from; a re-run of the month only rewrites the outputs
+# whose inputs changed and removes the ones that are no longer produced
+# -- the manifest is marked incomplete while files are being written, so after
+# -- a run that did not finish every output is written again
+# -- it also keeps the date printed on the invoices: the date is part of every
+# -- invoice's inputs, so a re-run on a later day keeps the month's date (see
+# -- run_date) and --rebuild dates the whole month again
+
+manifest_name = 'manifest.json'
+
+##### hash of some input text
+def text_hash(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        add_text(h, part)
+    return h.hexdigest()
+
+##### add one part to a running text_hash
+def add_text(h, part):
+    h.update(str(part).encode())
+    h.update(b'\0')
     return
 
-##### close root i.e. the main program
-def close_root():
-    # global vars
-    global root
-    global final_end
+##### hash of a table: its columns, their types and every value
+# -- pandas hashes the rows to 8 bytes each, no text copy of the table is made
+def table_hash(tabl):
+    h = hashlib.sha256()
+    add_text(h, list(tabl.columns))
+    add_text(h, [str(dtype) for dtype in tabl.dtypes])
+    h.update(pd.util.hash_pandas_object(tabl, index=False).values.tobytes())
+    return h.hexdigest()
+
+##### write the manifest file
+def save_manifest(manifest, outputs, complete):
+    tmp_path = manifest['path']+'.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'complete': complete, 'date': manifest['date'], 'outputs': outputs}, f,
+                  indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest['path'])
+    return
 
-    # destroy root
-    root.destroy()
-    # set checkpoint
-    final_end = True
+##### read the month's manifest and mark it as in progress
+# - previous: outputs of the last run: path in the month directory -> hash
+# - trusted: whether the last run finished
+# - outputs: filled in by this run
+# - date: date on the invoices of the last run, set to this run's by the caller
+def load_manifest(dirs):
+    manifest = {'path': dirs['path']+'/'+manifest_name, 'base': dirs['path'],
+                'previous': {}, 'trusted': False, 'outputs': {}, 'date': None}
+    try:
+        with open(manifest['path']) as f:
+            prev = json.load(f)
+        manifest['previous'] = prev.get('outputs', {})
+        manifest['trusted'] = prev.get('complete', False)
+        manifest['date'] = prev.get('date')
+    except (OSError, ValueError):
+        pass
+    save_manifest(manifest, manifest['previous'], False)
+    return manifest
+
+##### date printed on the month's invoices
+# - incremental: the date of the month's last run if there was one, else today
+def run_date(dirs, incremental=True):
+    today = datetime.datetime.today().strftime('%B %d, %Y')
+    if not incremental:
+        return today
+    try:
+        with open(dirs['path']+'/'+manifest_name) as f:
+            date = json.load(f).get('date')
+    except (OSError, ValueError):
+        return today
+    return date or today
+
+##### record an output and check if the file on disk is up to date
+def is_current(manifest, out_path, input_hash):
+    rel = os.path.relpath(out_path, manifest['base'])
+    manifest['outputs'][rel] = input_hash
+    return manifest['trusted'] and \
+           manifest['previous'].get(rel) == input_hash and \
+           os.path.exists(out_path)
+
+##### remove the outputs that are no longer produced and save the manifest
+def finish_manifest(manifest):
+    removed = 0
+    for rel in manifest['previous']:
+        if rel in manifest['outputs']:
+            continue
+        out_path = os.path.join(manifest['base'], rel)
+        if os.path.exists(out_path):
+            os.remove(out_path)
+            removed += 1
+        # email directories are per client
+        out_dir = os.path.dirname(out_path)
+        if os.path.basename(os.path.dirname(out_dir)) == 'emails':
+            try:
+                os.rmdir(out_dir) # only if empty
+            except OSError:
+                pass
+    if removed > 0:
+        print('Removed %d old files.' % removed)
+    save_manifest(manifest, manifest['outputs'], True)
     return
 
 # ------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------
-# HELPER FUNCTIONS for navigating
+# ADJUSTMENTS
+# the operator's changes to a row - the gui session and the --batch file both
+# go through apply_adjustment so the written files do not depend on the mode
+
+##### columns of the adjustments file
+# INCLUDE is 1 to keep the row, 0 to leave it out of the outgoing files
+# ROW (optional) is the 0 based row of the data template, else the file order
+adjust_cols = ['MONTHLY_CHARGE', 'ADD_CHARGE', 'ADD_CHARGE_NOTES',
+               'MY_NOTES', 'CUST_REMINDER', 'INCLUDE']
+
+##### update a row of the table with the operator's values
+# - amounts in cents
+def apply_adjustment(tabl, included, row, monthly_charge, add_charge,
+                     add_charge_notes, my_notes, cust_reminder, include=True):
+    # update data
+    tabl.at[row, 'MONTHLY_CHARGE'] = monthly_charge
+    tabl.at[row, 'ADD_CHARGE'] = add_charge
+    tabl.at[row, 'ADD_CHARGE_NOTES'] = add_charge_notes
+    tabl.at[row, 'MY_NOTES'] = my_notes
+    tabl.at[row, 'CUST_REMINDER'] = cust_reminder
+    # included update
+    included[row] = 1 if include else 0
+    return
 
-# check value of checkbutton
-# - if its clicked, then turn it on to appropriate color
-# - else leave it deafault black color
-def on_check():
-    global var, chk
-    if var.get() == 1:
-        chk["fg"] = on_color
-    else:
-        chk["fg"] = off_color
+##### read an adjustments file and apply it to the table
+# - blank charges and notes keep the table's value: the workbook's, or what an
+#   ADD_CHARGE_FORMULA column set (no additional charge otherwise)
+def load_adjustments(tabl, included, adjust_path):
+    N = tabl.shape[0]
+    adjust = pd.read_csv(adjust_path, dtype=str, keep_default_na=False)
+    # check for proper columns
+    missing = [col for col in adjust_cols if col not in adjust.columns]
+    if len(missing) > 0:
+        raise InvoiceError('Adjustments file is missing columns: ' + ', '.join(missing))
+    if 'ROW' not in adjust.columns and adjust.shape[0] != N:
+        raise InvoiceError('Adjustments file needs one line per row or a ROW column.')
+
+    for k, line in enumerate(adjust.to_dict('records')):
+        # row of the table
+        # -- line k+2 of the csv, after its header
+        row = k
+        if 'ROW' in line:
+            try:
+                row = int(line['ROW'].strip())
+            except ValueError:
+                raise InvoiceError('Adjustments file line %d: ROW must be a row number, '
+                                   'not %r.' % (k+2, line['ROW']))
+        if row < 0 or row > N-1:
+            raise InvoiceError('Adjustments file row %d is out of range.' % row)
+        # amounts
+        try:
+            monthly_charge = tabl.at[row, 'MONTHLY_CHARGE']
+            if line['MONTHLY_CHARGE'].strip() != '':
+                monthly_charge = eval_cents(line['MONTHLY_CHARGE'])
+            add_charge = tabl.at[row, 'ADD_CHARGE']
+            if line['ADD_CHARGE'].strip() != '':
+                add_charge = eval_cents(line['ADD_CHARGE'])
+        except CalcError as err:
+            raise InvoiceError('Adjustments file row %d: amounts must be real numbers (%s).'
+                               % (row, err))
+        # notes
+        my_notes = line['MY_NOTES'].strip()
+        if my_notes == '':
+            my_notes = tabl.at[row, 'MY_NOTES']
+        # include indicator
+        include = line['INCLUDE'].strip() not in ['0', 'no', 'No', 'NO']
+
+        apply_adjustment(tabl, included, row, monthly_charge, add_charge,
+                         line['ADD_CHARGE_NOTES'].strip(), my_notes,
+                         line['CUST_REMINDER'].strip(), include)
     return
 
-##### function to begin the main program
-def begin():
-    # global vars
-    global btn_one, btn_two
-    global monthly_charge_lbl, monthly_charge_entry
-    global add_charge_lbl, add_charge_entry
-    global add_charge_notes_lbl, add_charge_notes_entry
-    global my_notes_lbl, my_notes_entry
-    global cust_reminder_lbl, cust_reminder_entry
-    global chk
-    global row_inc, col_inc
-
-    ##### main label
-    main_lbl.grid_forget()
-
-    ##### first button
-    # change text: begin -> next
-    # change command
-    # if clicked, we move to the next row
-    # for proper display, we forget it so that we can place it at the end later
-    btn_one.grid_forget()
-    btn_one.config(text= 'Next')
-    btn_one.config(command= next)
-
-    ##### second button
-    # change text: close -> back
-    # change command
-    # if clicked, we move back to the previous row
-    # for proper display, we forget it so that place it at the end later
-    btn_two.grid_forget()
-    btn_two.config(text= 'Back')
-    btn_two.config(command= back)
-
-    ##### pack the labels and entries
-    # main label
-    main_lbl.grid(row= row_inc, column= col_inc, pady= pad, columnspan=2)
-    row_inc += 1
-    # monthly charge
-    monthly_charge_lbl.grid(row= row_inc, column= col_inc, pady= pad)
-    monthly_charge_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
-    row_inc += 1
-    # additional charge
-    add_charge_lbl.grid(row= row_inc, column= col_inc, pady= pad)
-    add_charge_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
-    row_inc += 1
-    # notes on additional charges
-    add_charge_notes_lbl.grid(row= row_inc, column= col_inc, pady= pad)
-    add_charge_notes_entry .grid(row= row_inc, column= col_inc+1, padx= pad)
-    row_inc += 1
-    # my notes
-    my_notes_lbl.grid(row= row_inc, column= col_inc, pady= pad)
-    my_notes_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
-    row_inc += 1
-    # customer reminders
-    cust_reminder_lbl.grid(row= row_inc, column= col_inc, pady= pad)
-    cust_reminder_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
-    row_inc += 1
-    # check button
-    chk.grid(row= row_inc, column= col_inc, pady= pad)
-    row_inc += 1
-
-    ##### pack back in the next button, but not the back button just yet
-    # - turn the back button on at the second row
-    btn_one.grid(row= row_inc, column= col_inc, pady= pad)
-
-    # revert row increment
-    row_inc = 0
-
-    ##### update the display
-    update()
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# INVOICE GROUPS
+# some clients get one invoice for several rows, e.g. an owner with several
+# properties; the groups are worked out for the whole table in one pass
+# -- rows with the same GROUP key are a group, whatever their order
+# -- rp rows without a key are grouped in threes in row order; a last group
+# -- of fewer than three still gets its invoice
+# -- only included rows count, and a group is rendered with the mult template
+# -- at its last row, the row its direction and email come from
+
+##### group of every row -> (group per row, -1 if none; last row of each group)
+def build_groups(tabl, included):
+    N = tabl.shape[0]
+    included = np.asarray(included) == 1
+    keys = tabl['GROUP'].astype(str).str.strip().to_numpy(dtype=object)
+    keyed = included & (keys != '')
+    rp = included & ~keyed & (tabl['RP_INDICATOR'].to_numpy() == 1)
+
+    ##### group keys - None for rows on their own
+    group_key = np.full(N, None, dtype=object)
+    group_key[keyed] = 'key:' + pd.Series(keys[keyed], dtype=object)
+    group_key[rp] = 'rp:' + pd.Series(np.arange(rp.sum()) // 3).astype(str)
+    group, uniques = pd.factorize(group_key)
+
+    ##### last row of every group
+    grouped = np.flatnonzero(group >= 0)
+    group_last = np.full(len(uniques), -1, dtype=np.int64)
+    np.maximum.at(group_last, group[grouped], grouped)
+    return group, group_last
+
+##### turns the included rows, in row order, into render jobs
+# - included: the include indicators the groups are worked out from
+# -- used for the whole table by build_jobs, and a row at a time by the
+# -- prerenderer while the operator works through the rows
+class JobBuilder:
+    def __init__(self, tabl, included, month, year, date, paths):
+        self.month = month
+        self.year = year
+        self.date = date
+        self.paths = paths
+        self.included = np.array(included, copy=True)
+        # the columns the operator does not change
+        self.z_indicator = tabl['Z_INDICATOR'].to_numpy()
+        self.v_indicator = tabl['V_INDICATOR'].to_numpy()
+        self.direction = [d.strip() for d in tabl['DIRECTION'].tolist()]
+        ##### groups and their rows added so far
+        self.group, self.group_last = build_groups(tabl, self.included)
+        self.members = {} # group -> [(data, monthly charge, additional charge)], cents
+
+    # next included row -> (row, template path, data), None if it has no doc
+    # of its own
+    # - raises InvoiceError if a group has more rows than the mult template
+    #   shows
+    def add(self, i, data, monthly_charge, add_charge):
+        ### grouped rows - one doc at the last row of the group
+        g = self.group[i]
+        if g >= 0:
+            members = self.members.setdefault(g, [])
+            members.append((data, monthly_charge, add_charge))
+            if i != self.group_last[g]:
+                # nothing to do yet
+                return None
+            del self.members[g]
+            # a template without an ITEMS loop only shows M1..MN, the other
+            # rows would be left off the invoice but still be in its TOTAL
+            from render import group_slots
+            temp_path = self.paths['invoice_template_mult']
+            slots = group_slots(temp_path)
+            if slots is not None and len(members) > slots:
+                raise InvoiceError(
+                    'The group ending on workbook row %d has %d rows, but the '
+                    'mult template only shows %d. Loop over ITEMS in the '
+                    'template or split the group.' % (i+2, len(members), slots))
+            return (i, temp_path, self.group_data(members))
+
+        ### temp doc
+        if self.z_indicator[i] == 1: # Z stuff
+            if self.direction[i] == 'PP':
+                temp_path = self.paths['invoice_template_z']
+            else:
+                temp_path = self.paths['invoice_template_z_gg']
+        elif self.v_indicator[i] == 1: # v stuff
+            temp_path = self.paths['invoice_template_v']
+        else: # default
+            temp_path = self.paths['invoice_template']
+        return (i, temp_path, data)
+
+    # data for the doc of a group
+    # - M1, A1, A1_NOTES, M2, ... for every row, and ITEMS, the data of every
+    #   row, for templates that loop over the rows
+    def group_data(self, members):
+        data = {}
+        data['DATE'] = self.date
+        data['MONTH'] = self.month
+        data['YEAR'] = self.year
+        for k, (row_data, monthly_charge, add_charge) in enumerate(members):
+            data['M%d' % (k+1)] = row_data['MONTHLY_CHARGE']
+            data['A%d' % (k+1)] = row_data['ADD_CHARGE']
+            data['A%d_NOTES' % (k+1)] = row_data['ADD_CHARGE_NOTES']
+        data['ITEMS'] = [row_data for row_data, monthly_charge, add_charge in members]
+        data['CUST_REMINDER'] = members[-1][0]['CUST_REMINDER'] # cust reminder
+        ### total sum from the amounts in cents, not the formatted strings
+        amounts = np.array([(monthly_charge, add_charge)
+                            for row_data, monthly_charge, add_charge in members],
+                           dtype=np.int64)
+        data['TOTAL'] = format_money([amounts.sum()])[0]
+        return data
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# RENDER CONTEXTS
+# the data placed in the docs is built column by column for a chunk of rows at
+# a time, instead of one pandas row at a time or the whole table at once
+# -- the jobs are generated as they are rendered, so the memory they use does
+# -- not grow with the number of clients
+
+##### data to place in the doc for every row of the table
+# - the table needs its TOTAL column (see write_outputs)
+def build_contexts(tabl, month, year, date):
+    # plain dicts, one per row
+    contexts = tabl.to_dict('records')
+    # format the amounts, cents -> currency strings
+    add_charge = tabl['ADD_CHARGE'].to_numpy(dtype=np.int64)
+    money_strs = {col: format_money(tabl[col]) for col in money_cols}
+    for k, data in enumerate(contexts):
+        # add dates
+        data['DATE'] = date
+        data['MONTH'] = month
+        data['YEAR'] = year
+        for col in money_cols:
+            data[col] = money_strs[col][k]
+        # if no additional charge then show nothing
+        if add_charge[k] == 0:
+            data['ADD_CHARGE'] = ''
+    return contexts
+
+##### render jobs in row order: (row, template path, data)
+# - a generator, call it again to go over the jobs again
+# - the table needs its TOTAL column (see write_outputs)
+# - chunk_rows: rows whose data is built at once
+def build_jobs(tabl, included, month, year, date, paths, chunk_rows=1000):
+    N = tabl.shape[0]
+
+    # the columns the loop needs
+    monthly_charge = tabl['MONTHLY_CHARGE'].to_numpy(dtype=np.int64)
+    add_charge = tabl['ADD_CHARGE'].to_numpy(dtype=np.int64)
+    builder = JobBuilder(tabl, included, month, year, date, paths)
+
+    # loop
+    for start in range(0, N, chunk_rows):
+        # data for the rows of the chunk
+        contexts = build_contexts(tabl.iloc[start:start+chunk_rows],
+                                  month, year, date)
+        for i in range(start, start+len(contexts)):
+            # do not include the current row
+            if included[i] == 0:
+                continue # skip it
+            job = builder.add(i, contexts[i-start], monthly_charge[i], add_charge[i])
+            # hand the doc over for rendering
+            if job is not None:
+                yield job
     return
 
-##### update the gui display
-def update():
-    # global vars
-    global index
-    global error_str, error_lbl
-    global back_on, last_back, back_str
-    global btn_one,  btn_two
-    global var, chk
-    global main_lbl
-    global monthly_charge_lbl, monthly_charge_entry
-    global add_charge_lbl, add_charge_entry
-    global add_charge_notes_lbl, add_charge_notes_entry
-    global my_notes_lbl, my_notes_entry
-    global cust_reminder_lbl, cust_reminder_entry
-    global CURR_DATE, MONTH
-    global dates_err_ind, remind_ind
-    global row_inc, col_inc
-
-    ##### clear the entries
-    monthly_charge_entry.delete(0, 'end')
-    add_charge_entry.delete(0, 'end')
-    add_charge_notes_entry.delete(0, 'end')
-    my_notes_entry.delete(0, 'end')
-    cust_reminder_entry.delete(0, 'end')
-    ##### reset checkbox
-    var.set(0) # value -> set it back to zero ie off
-    chk["fg"] = off_color # color -> set back to off color, not clicked
-
-    ##### error string and label logic
-    if error_str != '': # add in the error label and message
-        error_lbl.config(text= error_str)
-        error_lbl.grid(row= last_row+1, column= col_inc, pady = 0, columnspan=2)
-    else:
-        # remove the error lbl if present before
-        # if error was not present before, this does nothing
-        error_lbl.grid_forget()
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# PRERENDER
+# while the operator works through the rows, each committed row is rendered on
+# a background thread into the render cache, so the write phase after the
+# session finds its invoices there and is left with composing and saving
+# -- the cache is keyed by the template and the data placed in it, so a row
+# -- that is changed after going back is simply rendered again under its new
+# -- key; a group's invoice is rendered when its last row is committed
+# -- only used with the render cache on
+
+##### background renderer fed by the gui session
+# - commit(row) after every committed row, close() when the session is over
+class Prerenderer:
+    # - date: date on the invoices, the one the write phase will use (run_date)
+    def __init__(self, tabl, included, month, year, date, paths, cache, fast=False):
+        self.tabl = tabl
+        self.included = included
+        self.month = month
+        self.year = year
+        self.date = date
+        self.paths = paths
+        self.cache = cache
+        self.fast = fast
+        self.rows = {} # committed row -> (data, monthly, add), None if excluded
+        self.last_row = -1 # last row given to the builder
+        self.builder = JobBuilder(tabl, included, month, year, self.date, paths)
+        self.latest = {} # row -> number of its latest job
+        self.n_queued = 0
+        self.rendered = 0
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=instrument.run_profiled, args=(self.run,),
+                                       daemon=True)
+        self.thread.start()
+
+    # data for the doc of a row, as build_jobs makes it at write time
+    def row_data(self, row):
+        chunk = self.tabl.iloc[[row]].copy()
+        chunk['TOTAL'] = chunk['MONTHLY_CHARGE'] + chunk['ADD_CHARGE']
+        chunk['INCLUDED'] = self.included[[row]]
+        return build_contexts(chunk, self.month, self.year, self.date)[0]
+
+    # a row was committed by the operator - runs on the gui thread
+    def commit(self, row):
+        if self.included[row] == 0:
+            self.rows[row] = None
+        else:
+            self.rows[row] = (self.row_data(row),
+                              int(self.tabl.at[row, 'MONTHLY_CHARGE']),
+                              int(self.tabl.at[row, 'ADD_CHARGE']))
+        # went back, or the row was left out or put back in, which can change
+        # the groups: start the builder over from the rows before this one
+        # -- their jobs are queued again, the ones already in the cache are
+        # -- skipped by the worker
+        if row <= self.last_row or self.builder.included[row] != self.included[row]:
+            self.builder = JobBuilder(self.tabl, self.included, self.month,
+                                      self.year, self.date, self.paths)
+            for k in range(row):
+                self.feed(k)
+        self.feed(row)
+        return
 
-    ##### back button logic
-    # --------------------------------------------------------------------------
-    # add the 'back button' if index > 0; we don't want a back button for the
-    # first row becuase there is nothing to go back to; close the window to quit
-    if index == 1 and back_on == False:
-        # pack the back button
-        btn_two.grid(row= last_row, column= col_inc+1, padx= pad)
-        # update conditional that the 'back button' is on
-        back_on = True
-    # --------------------------------------------------------------------------
-    # remove back button if on index=0 i.e. we got back to the first row and
-    # need to remove the back button because there is nothing to go back to
-    if index == 0 and back_on == True:
-        btn_two.grid_forget() # remove button
-        back_on = False # update conditional
-    # --------------------------------------------------------------------------
-    # going back from the exit - last - screen
-    if last_back == True:
-        # we want to restore the main gui format
-        # -- i.e. the labels and entries followed by the buttons
-
-        ##### forget the buttons
-        btn_one.grid_forget()
-        btn_two.grid_forget()
-
-        ##### bring back the labels and entries
-        # increment row bc we do not forget the main label
-        row_inc += 1
-        # monthly charge
-        monthly_charge_lbl.grid(row= row_inc, column= col_inc, pady= pad)
-        monthly_charge_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
-        row_inc += 1
-        # additional charge
-        add_charge_lbl.grid(row= row_inc, column= col_inc, pady= pad)
-        add_charge_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
-        row_inc += 1
-        # additional charge notes
-        add_charge_notes_lbl.grid(row= row_inc, column= col_inc, pady= pad)
-        add_charge_notes_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
-        row_inc += 1
-        # my notes
-        my_notes_lbl.grid(row= row_inc, column= col_inc, pady= pad)
-        my_notes_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
-        row_inc += 1
-        # customer reminders
-        cust_reminder_lbl.grid(row= row_inc, column= col_inc, pady= pad)
-        cust_reminder_entry.grid(row= row_inc, column= col_inc+1, padx= pad)
-        row_inc += 1
-        # check button
-        chk.grid(row= row_inc, column= col_inc, pady= pad)
-        row_inc += 1
-
-        ##### bring back the buttons
-        btn_one.grid(row= row_inc, column= col_inc, pady= pad)
-        btn_two.grid(row= row_inc, column= col_inc+1, padx= pad)
-        # reconfig the first button i.e. the begin button at start, close at end
-        btn_one.config(text= 'Next') # update text
-        btn_one.config(command= next) # update command
-
-        ###### update last_back conditional i.e. if we press the back button
-        # we are no longer on the end screen, coming back from the exit screen
-        last_back = False
-    ##### END ----------------------------------------------- back button logic
-
-    ##### update logic
-    # check if we can update
-    # if no more rows left, end
-    # if we can update, replace entries with appropriate text
-    if index > N-1:
-        end() # end screen logic
-    else:
-        # grab current line
-        curr_line = dict(tabl.iloc[index])
-
-        ##### input entries
-        ## main label text
-        text = ''
-        # inform user that we've come back to this row
-        if back_str != '':
-            text += back_str
-            # revert back string
-            back_str = ''
-        # main info
-        text += curr_line['FIRST']+' '+ curr_line['LAST'] + '\n\n' + \
-                curr_line['STREET_ADDRESS'] + '\n' + \
-                curr_line['CITY_ADDRESS']
-
-        ### ADD TEXT - conditional
-        ## cond
-        if curr_line['COND_MONTHS'] != 'exclude':
-            pot_cond_months = set("".join(curr_line['COND_MONTHS'].split(',')).split())
-            ## - proper months
-            if len(pot_cond_months - month_set) == 0:
-                # check if current month is in potential cond... months
-                if MONTH in pot_cond_months:
-                    remind_ind = True
-                    text += '\n\n' + \
-                    "Remember, it's time to charge for cond...." + \
-                    ' - $' + str(curr_line['COND_CHARGE'])
-
-            ## - improper months
-            else:
-                dates_err_ind = True
-                text += '\n\n' + "Error, improper cond... month"
-        ## filt
-        if curr_line['FILT_MONTHS'] != 'exclude':
-            pot_filt_months = set("".join(curr_line['FILT_MONTHS'].split(',')).split())
-            ## - proper months
-            if len(pot_filt_months - month_set) == 0:
-                # check if current month is in potential filt... months
-                if MONTH in pot_filt_months:
-                    ## double or single new line
-                    if remind_ind or dates_err_ind:
-                        text += '\n' + \
-                        "Remember, it's time to charge for filt...." + \
-                        ' - $' + str(curr_line['FILT_CHARGE'])
-                    else:
-                        text += '\n\n' + \
-                        "Remember, it's time to charge for filt...." + \
-                        ' - $' + str(curr_line['FILT_CHARGE'])
-                    remind_ind = True
-            ## - improper months
-            else:
-                if remind_ind or dates_err_ind:
-                    text += '\n' + "Error, improper filt... month"
-                else:
-                    text += '\n\n' + "Error, improper filt... month"
-                dates_err_ind = True
-
-        ##### update the main label
-        # color
-        if dates_err_ind == True: # first indicator, red if any error
-            main_lbl.config(fg= 'red')
-        elif remind_ind == True: # if no error, then can set reminder
-            main_lbl.config(fg= reminder_color)
-        else: # revert to default, black color
-            main_lbl.config(fg= 'black')
-        # text
-        main_lbl.config(text=text)
-        ##### revert indicators
-        dates_err_ind = False
-        remind_ind = False
-
-        ##### update entries
-        ## monthly charge entry
-        monthly_charge_entry.insert(0, curr_line['MONTHLY_CHARGE'])
-        ## my notes
-        my_notes_entry.insert(0, curr_line['MY_NOTES'])
+    # hand a committed row to the builder and queue its job
+    def feed(self, row):
+        self.last_row = row
+        committed = self.rows.get(row)
+        if committed is None:
+            return
+        try:
+            job = self.builder.add(row, *committed)
+        except InvoiceError:
+            return # left to the write phase, which reports the error
+        if job is None:
+            return
+        self.n_queued += 1
+        self.latest[row] = self.n_queued
+        self.queue.put((self.n_queued, job))
+        return
 
+    # render the queued jobs into the cache - runs on the background thread
+    def run(self):
+        from render import render_key, render_bytes
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            number, (i, temp_path, data) = item
+            # the row was committed again since
+            if self.latest.get(i) != number:
+                continue
+            key = render_key(temp_path, data)
+            if os.path.exists(self.cache.key_path(key)):
+                continue
+            try:
+                self.cache.put(key, render_bytes(temp_path, data, self.fast))
+            except Exception:
+                continue # left to the write phase, which reports the error
+            self.rendered += 1
+
+    # wait for the queued jobs, or drop them if the session was cancelled
+    def close(self, finish=True):
+        if not self.thread.is_alive():
+            return
+        if not finish:
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+        self.queue.put(None)
+        self.thread.join()
         return
 
-##### ending the program
-def end():
-    # global vars
-    global main_lbl
-    global btn_one
-    global monthly_charge_lbl, monthly_charge_entry
-    global add_charge_lbl, add_charge_entry
-    global add_charge_notes_lbl, add_charge_notes_entry
-    global my_notes_lbl, my_notes_entry
-    global cust_reminder_lbl, cust_reminder_entry
-    global chk
-    global last_back
-
-    ##### updating labels and buttons
-    ## update the text in the main label and its color
-    main_lbl.config(text= "You're done.")
-    main_lbl.config(fg= 'black')
-
-    ## update button one - originally the begin button then the next button
-    btn_one.config(text= 'Close') # update the text of the button
-    btn_one.config(command= close_root) # update the button's command
-    # no need to change affect of the back button
-
-    ##### forget the other labels and entries
-    # monthly charge
-    monthly_charge_lbl.grid_forget()
-    monthly_charge_entry.grid_forget()
-    # additonal charge
-    add_charge_lbl.grid_forget()
-    add_charge_entry.grid_forget()
-    # additional charge notes
-    add_charge_notes_lbl.grid_forget()
-    add_charge_notes_entry.grid_forget()
-    # my notes
-    my_notes_lbl.grid_forget()
-    my_notes_entry.grid_forget()
-    # customer reminder
-    cust_reminder_lbl.grid_forget()
-    cust_reminder_entry.grid_forget()
-    # check button
-    chk.grid_forget()
-
-    # going back from the end
-    last_back = True # update the indicator to restore main gui format
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# WRITE DOCS
+
+##### import the word libraries ahead of the write phase
+# - run on a background thread while the operator works through the rows
+# - the write phase imports them again, which waits on a warm up in progress
+def warm_imports():
+    import docx
+    import compose
+    import render
     return
 
-##### next - go to the next row
-def next():
-    # global vars
-    global index, error_str, var
-    global monthly_charge_entry
-    global add_charge_entry, add_charge_notes_entry
-    global my_notes_entry, cust_reminder_entry
 
-    # grab and try reading in input
-    try:
-        # monthly charge input
-        monthly_in_amt_str = monthly_charge_entry.get().strip()
-        if monthly_in_amt_str == '':
-            monthly_in_amt_str = '0'
-        monthly_in_amt = float(eval(monthly_in_amt_str))
-        # additional charge input
-        add_in_amt_str = add_charge_entry.get().strip()
-        if add_in_amt_str == '':
-            add_in_amt_str = '0'
-        add_in_amt = float(eval(add_in_amt_str))
-        # additional charge notes input
-        in_add_charge_notes = str(add_charge_notes_entry.get().strip())
-        # my_notes
-        in_my_notes = str(my_notes_entry.get().strip())
-        # cust_reminder
-        in_cust_reminder = str(cust_reminder_entry.get().strip())
-
-        # update data
-        tabl.at[index, 'MONTHLY_CHARGE'] = monthly_in_amt
-        tabl.at[index, 'ADD_CHARGE'] = add_in_amt
-        tabl.at[index, 'ADD_CHARGE_NOTES'] = in_add_charge_notes
-        tabl.at[index, 'MY_NOTES'] = in_my_notes
-        tabl.at[index, 'CUST_REMINDER'] = in_cust_reminder
-
-        ##### checkbox - included update
-        if var.get() == 1:
-            included[index] = 0
-
-        ##### clear the error string
-        # ie we have not run into an error at this point
-        error_str = ''
-
-        ##### update index -- bc we have no error
-        index += 1
-
-    # reached an error
-    except NameError:
-        # we have an error, so update error string
-        # and do not move forward with index
-        error_str = '\n\n' + \
-        'Previous error. Make sure amounts are valid real numbers.'
-
-    ##### update
-    # -- if we had no error, we update to the next row
-    # -- if we had an error, we re-update the current row with an error message
-    update()
+##### stop the write phase if the operator cancelled it
+# - checked between files, so no file is left half written; the manifest is
+#   still marked incomplete, so the next run writes every file again
+def check_cancel(cancel):
+    if cancel is not None and cancel.is_set():
+        raise WriteCancelled('Writing cancelled, every file of the month '
+                             'will be written again on the next run.')
     return
 
-##### next - go to the next row
-def back():
-    # global vars
-    global index, back_str, error_str
+##### path of the email invoice of a row
+def email_doc_path(tabl, i, dirs, month):
+    # path
+    if tabl['DIRECTION'][i].strip() == 'PP':
+        temp_emails_path = dirs['emails_path_pp']+'/'+tabl['EMAIL_ADDRESS'][i].strip()
+    else:
+        temp_emails_path = dirs['emails_path_gg']+'/'+tabl['EMAIL_ADDRESS'][i].strip()
+    # temp email paths word doc file name
+    temp_emails_path_doc = temp_emails_path+'/invoice_'+month+'_'
+    temp_emails_path_doc += '_'.join(tabl['FIRST'][i].strip().lower().split())
+    temp_emails_path_doc += '_'
+    temp_emails_path_doc += tabl['LAST'][i].strip().lower()
+    temp_emails_path_doc += '.docx'
+    return temp_emails_path_doc
+
+##### render the jobs and write the paper masters and the email invoices
+# - make_jobs: function returning the render jobs (see build_jobs), it is
+#   called twice, once to find what needs writing and once to render
+# - cache: optional render.RenderCache of previously rendered docs
+# - manifest: optional month manifest, only out of date files are written
+# - shard_size: paper invoices per volume
+# - volumes: write the paper masters as numbered volumes, composed in the
+#   worker processes (see compose.py)
+# - fast: render plain templates on the fast path (see render.py)
+# - listener: optional progress listener (see instrument.Progress)
+# - cancel: optional threading.Event, set to stop between files
+def write_invoices(tabl, make_jobs, dirs, month, year, fpage, n_jobs=1,
+                   cache=None, manifest=None, shard_size=100, volumes=False,
+                   fast=False, listener=None, cancel=None):
+    from docx import Document
+    from render import template_bytes, template_hash, render_key
+    from compose import FastComposer, ShardedMaster, master_spill_size
+
+    print("Writing files....")
+
+    ### first files
+    invoice_doc_path = {
+        'PP': dirs['sub_path_pp']+'/pp_invoice_'+month+'_'+year+'.docx',
+        'GG': dirs['sub_path_gg']+'/gg_invoice_'+month+'_'+year+'.docx'}
+
+    ##### what needs writing
+    # one pass over the jobs keeping a flag per job, not the docs or their data
+    email_ind = tabl['EMAIL_IND'].to_numpy()
+    direction = ['PP' if d.strip() == 'PP' else 'GG' for d in tabl['DIRECTION'].tolist()]
+    master_hash = {} # running hash of the invoices in each master
+    for d in ['PP', 'GG']:
+        master_hash[d] = hashlib.sha256()
+        add_text(master_hash[d], template_hash(fpage))
+    n_paper = {'PP': 0, 'GG': 0}
+    stale = [] # email invoices: out of date, paper invoices: None, see masters
+    for (i, temp_path, data) in make_jobs():
+        # if no email indicator, merge to paper invoice
+        if email_ind[i] == 0:
+            if manifest is not None:
+                add_text(master_hash[direction[i]], render_key(temp_path, data))
+            n_paper[direction[i]] += 1
+            stale.append(None)
+        elif manifest is None:
+            stale.append(True)
+        else:
+            stale.append(not is_current(manifest, email_doc_path(tabl, i, dirs, month),
+                                        render_key(temp_path, data)))
+    # master files: one master, or a volume per shard
+    master_paths = {}
+    for d in ['PP', 'GG']:
+        if volumes:
+            n_volumes = max(1, -(-n_paper[d] // shard_size))
+            master_paths[d] = [invoice_doc_path[d][:-len('.docx')]+'_vol%02d.docx' % (v+1)
+                               for v in range(n_volumes)]
+            add_text(master_hash[d], 'volumes of %d' % shard_size)
+        else:
+            master_paths[d] = [invoice_doc_path[d]]
+    write_master = {}
+    for d in ['PP', 'GG']:
+        current = [manifest is not None and
+                   is_current(manifest, master_path, master_hash[d].hexdigest())
+                   for master_path in master_paths[d]]
+        write_master[d] = not all(current)
+    n_todo = stale.count(True)
+    for d in ['PP', 'GG']:
+        if write_master[d]:
+            n_todo += n_paper[d]
+    if n_todo < len(stale):
+        print('%d of %d invoices are up to date.' % (len(stale)-n_todo, len(stale)))
+
+    # master docs are built during the loop and saved once after it
+    # -- reloading and re-saving the growing master for every paper invoice
+    # -- made the write phase quadratic in the number of paper clients
+    # -- volumes are composed in shards (see compose.py), one master is always
+    # -- composed here: FastComposer splices every invoice after the first of
+    # -- its template, merging shards would run the full Composer on each one
+    # -- --jobs only renders in parallel then
+    # -- the finished part of a master is spilled to disk and volumes are
+    # -- written as they are done (see compose.py), so the masters in memory
+    # -- do not grow with the paper invoices
+    sharded = volumes
+    compose_pool = None
+    if sharded and n_jobs > 1:
+        compose_pool = ProcessPoolExecutor(max_workers=n_jobs)
+    composers = {}
+    for d in ['PP', 'GG']:
+        if not write_master[d]:
+            continue
+        if sharded:
+            composers[d] = ShardedMaster(template_bytes(fpage), master_paths[d],
+                                         compose_pool, shard_size, 2*n_jobs)
+        else:
+            composers[d] = FastComposer(Document(io.BytesIO(template_bytes(fpage))),
+                                        spill_size=master_spill_size)
 
-    # revert index
-    index -= 1
+    # loop
+    todo_jobs = (job for k, job in enumerate(make_jobs())
+                 if stale[k] or (stale[k] is None and write_master[direction[job[0]]]))
+    progress = Progress(n_todo, listener=listener)
+    try:
+        write_docs(tabl, todo_jobs, composers, sharded, dirs, month, n_jobs,
+                   cache, fast, progress, cancel)
+
+        # save the master docs - once each
+        for d in composers:
+            check_cancel(cancel)
+            announce(listener, 'Saving the %s master' % d)
+            save_start = time.perf_counter()
+            with stage('master_save'):
+                if not sharded:
+                    composers[d].save(invoice_doc_path[d])
+                else:
+                    composers[d].finish()
+            # size and save time of the master
+            master_size = sum([os.path.getsize(p) for p in master_paths[d]])
+            record_bytes('master', master_size)
+            report = '%s master: %.2f MB, written in %.2f s' % (
+                d, master_size/1024/1024, time.perf_counter()-save_start)
+            if not sharded and composers[d].parts_removed > 0:
+                report += ', %d duplicate parts dropped' % composers[d].parts_removed
+            print(report+'.')
+    finally:
+        if compose_pool is not None:
+            compose_pool.shutdown(cancel_futures=True)
+
+    print("Files written.")
+    if cache is not None:
+        print('Render cache: %d reused, %d rendered.' % (cache.hits, cache.misses))
+    return
+
+##### render the jobs, compose the paper invoices and save the email invoices
+# - composers: direction -> master being built (see write_invoices)
+def write_docs(tabl, todo_jobs, composers, sharded, dirs, month, n_jobs,
+               cache, fast, progress, cancel):
+    from render import render_jobs, load_doc
+
+    email_ind = tabl['EMAIL_IND'].to_numpy()
+    direction = ['PP' if d.strip() == 'PP' else 'GG' for d in tabl['DIRECTION'].tolist()]
+    for i, temp_path, temp in timed_iter('render', render_jobs(todo_jobs, n_jobs,
+                                                               cache, fast)):
+        check_cancel(cancel)
+        # merge to paper invoice
+        if email_ind[i] == 0:
+            with stage('compose'):
+                composer = composers[direction[i]]
+                # volumes are composed from bytes
+                if sharded:
+                    if not isinstance(temp, bytes):
+                        buf = io.BytesIO()
+                        temp.save(buf)
+                        temp = buf.getvalue()
+                    composer.add(temp, temp_path)
+                else:
+                    # docs from the process pool, the cache or the fast path
+                    # come back as bytes
+                    if isinstance(temp, bytes):
+                        temp = load_doc(temp_path, temp)
+                    ### merge docs
+                    # add page break
+                    composer.doc.add_page_break()
+                    # merge it with the temp doc
+                    composer.append(temp, temp_path)
+        else:
+            with stage('email_save'):
+                temp_emails_path_doc = email_doc_path(tabl, i, dirs, month)
+                # make directory
+                os.makedirs(os.path.dirname(temp_emails_path_doc), exist_ok=True)
+                # save doc
+                if isinstance(temp, bytes):
+                    with open(temp_emails_path_doc, 'wb') as f:
+                        f.write(temp)
+                else:
+                    temp.save(temp_emails_path_doc)
+                record_bytes('email', os.path.getsize(temp_emails_path_doc))
+        # progress line
+        progress.update(item=(tabl['FIRST'][i]+' '+tabl['LAST'][i]).strip())
+    progress.finish()
+    return
 
-    # make sure we revert the included ariable indicator just in case
-    included[index] = 1
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# CREATE EXCEL SHEETS
+
+##### full and short spreadsheets for the month
+# - manifest: optional month manifest, only out of date files are written
+def write_spreadsheets(tabl, dirs, month, year, manifest=None):
+    N = tabl.shape[0]
+    path = dirs['path']
+
+    ##### CREATE EXCEL SHEET for output
+    # drop columns not needed
+    out_tabl = tabl.drop(['OWNER', 'EMAIL_ADDRESS',
+                          'COND_CHARGE', 'FILT_CHARGE',
+                          'COND_MONTHS', 'FILT_MONTHS',
+                          'RP_INDICATOR',
+                          'Z_INDICATOR', 'V_INDICATOR'] + opt_col_list, axis=1)
+
+    # column formats as in:
+    # https://xlsxwriter.readthedocs.io/example_pandas_column_formats.html
+    # the rows are written by XlsxWriter itself (see write_rows)
+    invoice_data = path+'/data_'+month+'_'+year+'.xlsx' # file path
+    if manifest is None or not is_current(manifest, invoice_data,
+                                          table_hash(out_tabl)):
+        with stage('excel_data'):
+            write_data_sheet(out_tabl, invoice_data)
+        record_bytes('spreadsheet', os.path.getsize(invoice_data))
+
+    ##### CREATE EXCEL SHEET for shorter output
+    # 'short' path
+    short_path = path+'/short_data_'+month+'_'+year+'.xlsx'
+    # create shorter data
+    short_tabl = out_tabl[['LAST','STREET_ADDRESS','ADD_CHARGE_NOTES']].copy()
+    # add month service column
+    short_tabl[month+' '+year] = out_tabl['MONTHLY_CHARGE'].copy()
+    # add recrods column
+    short_tabl['Records'] = ['']*N
+    if manifest is None or not is_current(manifest, short_path,
+                                          table_hash(short_tabl)):
+        with stage('excel_short'):
+            write_short_sheet(short_tabl, short_path)
+        record_bytes('spreadsheet', os.path.getsize(short_path))
+    return
 
-    # update back string
-    back_str = 'WENT BACK - '
+##### the full spreadsheet
+def write_data_sheet(out_tabl, invoice_data):
+    # money as numbers in dollars, shown with a currency format
+    out_tabl = out_tabl.copy()
+    for col in money_cols:
+        if col in out_tabl.columns:
+            out_tabl[col] = to_dollars(out_tabl[col])
+    workbook, worksheet = open_sheet(invoice_data)
+    # Set the column width and format.
+    worksheet.set_column('A:B', 18, None) # first, last
+    worksheet.set_column('C:D', 18*1.5, None) # street, city
+    worksheet.set_column('E:E', 18*2.5, None) # my notes
+    worksheet.set_column('F:F', 18, None) # monthly charge
+    worksheet.set_column('G:G', 18, None) # additional charge
+    worksheet.set_column('H:H', 18*2.5, None) # add charge notes
+    worksheet.set_column('I:I', 18*1.5, None) # cust reminder
+    worksheet.set_column('J:K', 18, None) # total, included
+    money_format = workbook.add_format({'num_format': money.excel_format})
+    for k, col in enumerate(out_tabl.columns):
+        if col in money_cols:
+            worksheet.set_column(k, k, 18, money_format)
+    write_rows(worksheet, out_tabl)
+    workbook.close()
+    return
 
-    # update error string - in case we were at an error
-    error_str = ''
+##### the short spreadsheet
+# - the month column is the monthly charge in cents
+def write_short_sheet(short_tabl, short_path):
+    # money as numbers in dollars, shown with a currency format
+    short_tabl = short_tabl.copy()
+    month_col = short_tabl.columns[3]
+    short_tabl[month_col] = to_dollars(short_tabl[month_col])
+    short_workbook, short_sheet = open_sheet(short_path)
+    # Set the column width and format.
+    short_sheet.set_column('A:A', 15, None) # last
+    short_sheet.set_column('B:B', 25, None) # street
+    short_sheet.set_column('C:C', 40, None) # add charge notes
+    money_format = short_workbook.add_format({'num_format': money.excel_format})
+    short_sheet.set_column('D:D', 15, money_format) # monthly service
+    short_sheet.set_column('E:E', 15, None) # records
+    # MARGINS
+    short_sheet.set_margins(left=0.1, right=0.1, top=0.1, bottom=0.1)
+    write_rows(short_sheet, short_tabl)
+    short_workbook.close()
+    return
 
-    # we went back, so now update the main gui display
-    update()
+##### a workbook that writes its rows to disk as they come -> (workbook, sheet)
+# - constant_memory: a row is written out once the next one starts, so the
+#   sheet in memory does not grow with the table; the columns are set before
+#   the rows, as their formats are taken when the cells are written
+def open_sheet(path):
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    return workbook, workbook.add_worksheet('Sheet1')
+
+##### header and rows of a table, a chunk of rows at a time
+# - the cells are the ones pandas.to_excel wrote: numpy values as python
+#   ones, missing values blank, the rest as text, no cell formats
+def write_rows(worksheet, tabl, chunk_rows=1000):
+    worksheet.write_row(0, 0, [str(col) for col in tabl.columns])
+    for start in range(0, tabl.shape[0], chunk_rows):
+        chunk = tabl.iloc[start:start+chunk_rows]
+        cols = [[excel_value(value) for value in chunk[col].tolist()]
+                for col in chunk.columns]
+        for k, row in enumerate(zip(*cols)):
+            worksheet.write_row(start+k+1, 0, row)
     return
 
+##### a table value as pandas.to_excel writes it
+def excel_value(value):
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return ''
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return float(value)
+    return str(value)
+
 # ------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------
-# SET-UP the gui
-
-##### root for gui
-root = tk.Tk()
-root.title('Invoice: '+MONTH+' '+YEAR)
-#root.configure(background='grey')
-
-##### center the window
-center_window(root, width, height)
-
-###### main label where we will show input
-main_lbl = tk.Label(root, text= 'Click to begin.')
-main_lbl.config(font= (font, size, bold_ind))
-main_lbl.config(fg= 'black')
-
-main_lbl.grid(row=0, column=0, pady=pad, columnspan=2)
-
-##### error label
-error_lbl = tk.Label(root, text= error_str)
-error_lbl.config(font= (font, size, bold_ind))
-error_lbl.config(fg= 'red')
-
-##### the button to begin -> next -> end program
-btn_one = tk.Button(root, text= 'Begin', command= begin,
-                highlightbackground= col1,
-                highlightthickness= thick)
-btn_one.config(font= (font, size, bold_ind))
-btn_one.grid(row=1, column=0, pady=pad)
-
-##### the button to close -> back
-btn_two = tk.Button(root, text= 'Close', command= close_root,
-                    highlightbackground= col2,
-                    highlightthickness= thick)
-btn_two.config(font= (font, size, bold_ind))
-btn_two.grid(row=1, column=1, pady=pad)
-
-##### monthly charge
-## label
-monthly_charge_lbl = tk.Label(root, text= 'Monthly Charge:')
-monthly_charge_lbl.config(font= (font, size, bold_ind))
-monthly_charge_lbl.config(fg= amt_color)
-## entry
-monthly_charge_entry = tk.Entry(root, width= entry_width)
-monthly_charge_entry.config(font= (font, size))
-
-##### additional charge
-## label
-add_charge_lbl = tk.Label(root, text= 'Additional Charge:')
-add_charge_lbl.config(font= (font, size, bold_ind))
-add_charge_lbl.config(fg= add_color)
-## entry
-add_charge_entry = tk.Entry(root, width= entry_width)
-add_charge_entry.config(font= (font, size))
-
-##### additional charge notes
-## label
-add_charge_notes_lbl = tk.Label(root, text= 'Notes on additional charge:')
-add_charge_notes_lbl.config(font= (font, size, bold_ind))
-add_charge_notes_lbl.config(fg= add_color)
-## entry
-add_charge_notes_entry = tk.Entry(root, width= entry_width)
-add_charge_notes_entry.config(font= (font, size))
-
-##### my notes
-## label
-my_notes_lbl = tk.Label(root, text= 'My notes:')
-my_notes_lbl.config(font= (font, size, bold_ind))
-my_notes_lbl.config(fg= notes_color)
-## entry
-my_notes_entry = tk.Entry(root, width= entry_width)
-my_notes_entry.config(font= (font, size))
-
-##### reminders
-## label
-cust_reminder_lbl = tk.Label(root, text= 'Set Customer Reminder:')
-cust_reminder_lbl.config(font= (font, size, bold_ind))
-cust_reminder_lbl.config(fg= cust_remind_color)
-## entry
-cust_reminder_entry = tk.Entry(root, width= entry_width)
-cust_reminder_entry.config(font= (font, size))
-
-##### include check button
-var = tk.IntVar()
-chk = tk.Checkbutton(root, text='Do Not Include?', variable=var,
-            selectcolor= 'blue', command= on_check, fg= off_color)
-chk.config(font= (font, size, bold_ind))
-# var.get()
-
-##### main loop
-root.mainloop()
-
-# check if we completed the main program all the way through or not
-# - if we did not, then exit with an error
-if final_end == False:
-    exit('Failed to complete full program.')
-
-# ------------------------------------------------------------------------------
-# ------------------------------------------------------------------------------
-# INITIALIZE DOC WRITING
-
-# ADD DATA i.e. total column, and current date for output doc
-# create total column
-tabl['TOTAL'] = tabl['MONTHLY_CHARGE'] + tabl['ADD_CHARGE']
-# add included
-tabl['INCLUDED'] = included
-
-# current date
-DATE = datetime.datetime.today().strftime('%B %d, %Y')
-
-# ------------------------------------------------------------------------------
-# ------------------------------------------------------------------------------
-# HELPER FUNCTION to grab appropriate data
-
-# grab a row from the table and process it for data to place in doc
-def grab_data(row):
-    # global data
-    global data
-
-    # convert to dict
-    data = dict(tabl.iloc[row])
-    # add dates
-    data['DATE'] = DATE
-    data['MONTH'] = MONTH
-    data['YEAR'] = YEAR
-    # if no additional charge then show nothing, else format float
-    if data['ADD_CHARGE'] == 0:
-        data['ADD_CHARGE'] = ''
-    else:
-        data['ADD_CHARGE'] = '${:,.2f}'.format(data['ADD_CHARGE'])
-    # format floats
-    data['MONTHLY_CHARGE'] = '${:,.2f}'.format(data['MONTHLY_CHARGE'])
-    data['TOTAL'] = '${:,.2f}'.format(data['TOTAL'])
-    return
+# WRITE OUTPUTS
+
+##### docs and spreadsheets for the adjusted table
+# - returns the total of the month in cents
+# - incremental: only rewrite the outputs whose inputs changed (see MANIFEST),
+#   else every output is written and the manifest recorded for the next run
+# - shard_size, volumes: how the paper masters are built (see write_invoices)
+# - fast: render plain templates on the fast path (see render.py)
+# - listener, cancel: progress listener and cancel event (see write_invoices)
+def write_outputs(tabl, included, month, year, paths, dirs, n_jobs=1,
+                  cache=None, incremental=True, shard_size=100, volumes=False,
+                  fast=False, listener=None, cancel=None):
+    # ADD DATA i.e. total column, and current date for output doc
+    # create total column
+    tabl['TOTAL'] = tabl['MONTHLY_CHARGE'] + tabl['ADD_CHARGE']
+    # add included
+    tabl['INCLUDED'] = included
+
+    # date on the invoices, the month's first date unless rebuilding
+    date = run_date(dirs, incremental)
+    if date != datetime.datetime.today().strftime('%B %d, %Y'):
+        print('Invoices are dated %s as in the earlier run (--rebuild dates them today).'
+              % date)
+
+    # outputs of the last run of the month
+    # -- kept with a rebuild too, so a cancelled rebuild is not trusted later
+    manifest = load_manifest(dirs)
+    manifest['date'] = date
+
+    # cache counts of this write only, one cache can serve several months
+    if cache is not None:
+        cache.reset_counts()
+    if not incremental:
+        manifest['trusted'] = False
+
+    # docs
+    def make_jobs():
+        return build_jobs(tabl, included, month, year, date, paths)
+    write_invoices(tabl, make_jobs, dirs, month, year, paths['fpage'], n_jobs,
+                   cache, manifest, shard_size, volumes, fast, listener, cancel)
+    # spreadsheets
+    check_cancel(cancel)
+    announce(listener, 'Writing the spreadsheets')
+    write_spreadsheets(tabl, dirs, month, year, manifest)
+
+    finish_manifest(manifest)
+    return int(tabl['TOTAL'].values.sum())
 
-##### set data originally to hold nothining
-data = None
-
-# ------------------------------------------------------------------------------
-# ------------------------------------------------------------------------------
-print("Writing files....")
-
-### first files
-doc_pp = DocxTemplate(fpage)
-doc_gg = DocxTemplate(fpage)
-invoice_doc_path_pp = sub_path_pp+'/pp_invoice_'+MONTH+'_'+YEAR+'.docx'
-invoice_doc_path_gg = sub_path_gg+'/gg_invoice_'+MONTH+'_'+YEAR+'.docx'
-doc_pp.save(invoice_doc_path_pp)
-doc_gg.save(invoice_doc_path_gg)
-
-# ------------------------------------------------------------------------------
-# ------------------------------------------------------------------------------
-# CONCATENATE DOC through loop
-
-##### 'rp' indicator and values --- specific use
-rp_inc = 0 # increment
-rp_ind = False # rp process completion indicator
-rp_months = []
-rp_adds = []
-rp_notes = []
-#####
-
-# loop
-for i in range(N):
-    # progress print
-    print(i)
-
-    # do not include the current row
-    if included[i] == 0:
-        continue # skip it
-
-    ##### create temp doc
-
-    # grab data and process it
-    grab_data(i)
-
-    ### temp doc
-    # rp conditionals
-    if tabl['RP_INDICATOR'][i] == 1:
-        # increment
-        rp_inc += 1
-        # have we seen three?
-        if rp_inc == 3:
-            # first append
-            rp_months.append(data['MONTHLY_CHARGE'])
-            rp_adds.append(data['ADD_CHARGE'])
-            rp_notes.append(data['ADD_CHARGE_NOTES'])
-            ### new data
-            rm = data['CUST_REMINDER'] # cust reminder
-            # save data for processing
-            data = {}
-            data['DATE'] = DATE
-            data['MONTH'] = MONTH
-            data['YEAR'] = YEAR
-            data['M1'] = rp_months[0]
-            data['M2'] = rp_months[1]
-            data['M3'] = rp_months[2]
-            data['A1'] = rp_adds[0]
-            data['A2'] = rp_adds[1]
-            data['A3'] = rp_adds[2]
-            data['A1_NOTES'] = rp_notes[0]
-            data['A2_NOTES'] = rp_notes[1]
-            data['A3_NOTES'] = rp_notes[2]
-            data['CUST_REMINDER'] = rm
-            ### loop for total sum
-            total_sum = 0
-            # month charge
-            for ele in rp_months:
-                if ele != '':
-                    total_sum += float(ele.strip('$'))
-            # add charge
-            for ele in rp_adds:
-                if ele != '':
-                    total_sum += float(ele.strip('$'))
-            data['TOTAL'] = '${:,.2f}'.format(total_sum)
-            rp_ind = True # finished the 'rp' process, note it
-        else:
-            # nothing to do yet but to append the data
-            rp_months.append(data['MONTHLY_CHARGE'])
-            rp_adds.append(data['ADD_CHARGE'])
-            rp_notes.append(data['ADD_CHARGE_NOTES'])
-            continue
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# MONTH RANGE and BUSINESSES
+# catch-up billing and several businesses in one process: every month from
+# --from to --to, for every business of a --businesses spec, with each client
+# table read once and the templates compiled once per process
+# -- each month of a business is a batch run: the table as read, with the
+# -- adjustments file if given, and its own reminders, directories and run report
+# -- with more than one job the months are written side by side in a process
+# -- pool, each month rendering serially; the render cache is keyed by template
+# -- contents, so businesses with the same templates share it
+
+##### months from e.g. 'July 2019' to 'December 2019' -> [(month, year)]
+def month_range(start, end):
+    bounds = []
+    for text in [start, end]:
+        parts = text.split()
+        if len(parts) != 2:
+            raise InvoiceError('Provide months like "July 2019", not "%s".' % text)
+        bounds.append(invoice_date(parts[0], parts[1]))
+    if bounds[1] < bounds[0]:
+        raise InvoiceError('The range ends before it starts.')
+    months = []
+    month_date = bounds[0]
+    while month_date <= bounds[1]:
+        months.append((month_date.strftime('%B'), month_date.strftime('%Y')))
+        # first of the next month
+        month_date = (month_date + datetime.timedelta(days=32)).replace(day=1)
+    return months
+
+##### columns of the businesses file, one line per business
+# TEMPLATES is the template directory, the others are optional:
+# NAME (default: the template directory), DATA (default: the data template in
+# TEMPLATES), OUTPUT (default: invoices next to the file), ADJUSTMENTS (a
+# --batch file for the business)
+# -- relative paths are taken from the directory of the businesses file
+business_cols = ['NAME', 'TEMPLATES', 'DATA', 'OUTPUT', 'ADJUSTMENTS']
+
+##### read a businesses file -> [{'name', 'paths', 'out_root', 'adjust_path'}]
+def read_businesses(spec_path):
+    spec = pd.read_csv(spec_path, dtype=str, keep_default_na=False)
+    if 'TEMPLATES' not in spec.columns:
+        raise InvoiceError('Businesses file is missing the TEMPLATES column.')
+    base = os.path.dirname(os.path.abspath(spec_path))
+    def spec_path_of(value):
+        return os.path.normpath(os.path.join(base, value.strip()))
+
+    businesses = []
+    for k, line in enumerate(spec.to_dict('records')):
+        if line['TEMPLATES'].strip() == '':
+            raise InvoiceError('Businesses file line %d has no TEMPLATES.' % (k+1))
+        paths = template_paths(spec_path_of(line['TEMPLATES']))
+        if line.get('DATA', '').strip() != '':
+            paths['invoice_data_template'] = spec_path_of(line['DATA'])
+        out_root = spec_path_of(line.get('OUTPUT', '').strip() or 'invoices')
+        adjust_path = None
+        if line.get('ADJUSTMENTS', '').strip() != '':
+            adjust_path = spec_path_of(line['ADJUSTMENTS'])
+        businesses.append({'name': line.get('NAME', '').strip() or line['TEMPLATES'].strip(),
+                           'paths': paths, 'out_root': out_root,
+                           'adjust_path': adjust_path})
+    # two businesses writing into one month directory would overwrite each other
+    out_roots = [os.path.abspath(business['out_root']) for business in businesses]
+    if len(set(out_roots)) != len(out_roots):
+        raise InvoiceError('Businesses file: every business needs its own OUTPUT.')
+    return businesses
+
+##### one month of one business -> summary of the month
+# - tabl: the client table as read, it is copied and not changed
+# - options: keyword arguments for write_outputs
+def write_month(tabl, month, year, paths, adjust_path=None, options=None,
+                out_root='invoices'):
+    if options is None:
+        options = {}
+    month_start = time.perf_counter()
+    instrument.reset_stats()
+    tabl = tabl.copy()
+    included = np.ones(tabl.shape[0], dtype=int)
+    with stage('reminders'):
+        reminders = build_reminders(tabl, month)
+    report_reminders(tabl, reminders, month)
+    with stage('directories'):
+        dirs = make_directories(month, year, out_root)
+    if adjust_path is not None:
+        with stage('adjustments'):
+            load_adjustments(tabl, included, adjust_path)
+    total = write_outputs(tabl, included, month, year, paths, dirs, **options)
+    summary = {'month': month, 'year': year, 'rows': int(tabl.shape[0]),
+               'included': int(included.sum()), 'total': total/100,
+               'total_cents': total,
+               'jobs': options.get('n_jobs', 1),
+               'elapsed': round(time.perf_counter()-month_start, 3)}
+    instrument.save_report(dirs['path']+'/run_report.json', summary)
+    summary['path'] = dirs['path']
+    return summary
+
+##### write_month for every task -> summaries in task order
+# - task: (tabl, month, year, paths, adjust_path, out_root)
+# - n_jobs: tasks written at once, or the processes rendering a single task
+def write_tasks(tasks, n_jobs=1, options=None):
+    if options is None:
+        options = {}
+    if n_jobs == 1 or len(tasks) == 1:
+        # one month at a time, each rendering with n_jobs processes
+        options = dict(options, n_jobs=n_jobs)
+        return [write_month(tabl, month, year, paths, adjust_path, options, out_root)
+                for tabl, month, year, paths, adjust_path, out_root in tasks]
+    options = dict(options, n_jobs=1)
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks))) as pool:
+        futures = [pool.submit(write_month, tabl, month, year, paths,
+                               adjust_path, options, out_root)
+                   for tabl, month, year, paths, adjust_path, out_root in tasks]
+        return [future.result() for future in futures]
+
+##### every month of a range for one business -> summaries in month order
+def write_range(tabl, months, paths, n_jobs=1, adjust_path=None, options=None,
+                out_root='invoices'):
+    tasks = [(tabl, month, year, paths, adjust_path, out_root)
+             for month, year in months]
+    return write_tasks(tasks, n_jobs, options)
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# MAIN PROGRAM
+
+def main(argv=None):
+    # check command line args for month and year of invoice
+    parser = argparse.ArgumentParser(
+        description='Fill out the invoices for a month.',
+        epilog='example use: python code/invoice.py September 2019')
+    parser.add_argument('month', nargs='?') # first argument is the month
+    parser.add_argument('year', nargs='?') # second argument is the year
+    parser.add_argument('--from', dest='start', metavar='"MONTH YEAR"',
+                        help='first month of a range of months, written '
+                             'without the gui session (see --batch)')
+    parser.add_argument('--to', dest='end', metavar='"MONTH YEAR"',
+                        help='last month of the range')
+    parser.add_argument('--businesses', metavar='SPEC',
+                        help='csv of businesses (TEMPLATES, and optional NAME, '
+                             'DATA, OUTPUT, ADJUSTMENTS) written side by side '
+                             'without the gui session')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of processes used to render the invoices')
+    parser.add_argument('--batch', metavar='ADJUSTMENTS',
+                        help='csv of per-row adjustments; skips the gui session')
+    parser.add_argument('--cache-dir', default='.render_cache',
+                        help='directory of previously rendered invoices')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help='size limit of the render cache in MB')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='render every invoice again')
+    parser.add_argument('--no-prerender', action='store_true',
+                        help='do not render the invoices in the background '
+                             'during the gui session')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='rewrite every output file of the month')
+    parser.add_argument('--shard-size', type=int, default=100,
+                        help='paper invoices per volume (see --volumes)')
+    parser.add_argument('--volumes', action='store_true',
+                        help='write the paper masters as numbered volumes of '
+                             'SHARD_SIZE invoices')
+    parser.add_argument('--fast-render', action='store_true',
+                        help='fill plain templates without docxtpl, others '
+                             'still go through docxtpl')
+    parser.add_argument('--profile', choices=instrument.profile_kinds,
+                        default=os.environ.get('INVOICE_PROFILE') or None,
+                        help='profile this run, the result is written to the '
+                             'month directory (or set INVOICE_PROFILE)')
+    args = parser.parse_args(argv)
+    if args.start is not None or args.end is not None or args.businesses is not None:
+        return main_batch(args)
+    if args.month is None or args.year is None:
+        exit('Missing MONTH and/or YEAR argument.')
+    MONTH = args.month
+    YEAR = args.year
+    profiler = instrument.start_profile(args.profile)
 
-    ### temp doc
-    if rp_ind: # rp stuff
-        temp = DocxTemplate(invoice_template_mult)
-        rp_ind = False # revert rp process completion indicator for next round
-    elif tabl['Z_INDICATOR'][i] == 1: # Z stuff
-        if tabl['DIRECTION'][i].strip() == 'PP':
-            temp = DocxTemplate(invoice_template_z)
+    try:
+        invoice_date(MONTH, YEAR)
+        paths = template_paths()
+        check_files(paths)
+
+        # client table
+        with stage('load'):
+            tabl = load_table(paths['invoice_data_template'])
+        # indicator for whether to include rows or not for the outgoing files
+        included = np.ones(tabl.shape[0], dtype=int)
+
+        # cond/filt reminders for the month
+        with stage('reminders'):
+            reminders = build_reminders(tabl, MONTH)
+        report_reminders(tabl, reminders, MONTH)
+
+        with stage('directories'):
+            dirs = make_directories(MONTH, YEAR)
+
+        # previously rendered invoices
+        cache = None
+        if not args.no_cache:
+            from render import RenderCache
+            cache = RenderCache(args.cache_dir, args.cache_size*1024*1024)
+
+        # docs and spreadsheets for the adjusted table
+        total = None
+        def write(listener=None, cancel=None):
+            nonlocal total
+            total = write_outputs(tabl, included, MONTH, YEAR, paths, dirs,
+                                  max(1, args.jobs), cache, not args.rebuild,
+                                  max(1, args.shard_size), args.volumes,
+                                  args.fast_render, listener, cancel)
+            return total
+
+        # batch mode: the adjustments file stands in for the gui session
+        if args.batch is not None:
+            with stage('adjustments'):
+                load_adjustments(tabl, included, args.batch)
+            write()
         else:
-            temp = DocxTemplate(invoice_template_z_gg)
-    elif tabl['V_INDICATOR'][i] == 1: # v stuff
-        temp = DocxTemplate(invoice_template_v)
-    else: # default
-        temp = DocxTemplate(invoice_template)
-    # render the doc
-    temp.render(data)
-
-    # if no email indicator, merge to paper invoice
-    if tabl['EMAIL_IND'][i] == 0:
-        ### merge docs
-        # check for DIRECTION
-        if tabl['DIRECTION'][i].strip() == 'PP':
-            # path
-            doc_path = invoice_doc_path_pp
+            import gui
+            # get the word libraries ready while the window is up
+            threading.Thread(target=warm_imports, daemon=True).start()
+            # and render the committed rows into the cache (see PRERENDER)
+            prerender = None
+            if cache is not None and not args.no_prerender:
+                prerender = Prerenderer(tabl, included, MONTH, YEAR,
+                                        run_date(dirs, not args.rebuild), paths,
+                                        cache, args.fast_render)
+            def commit(row, *values):
+                apply_adjustment(tabl, included, row, *values)
+                if prerender is not None:
+                    prerender.commit(row)
+            # the write phase runs behind the window's progress view once the
+            # operator closes the session (see gui.py)
+            session_start = time.perf_counter()
+            def write_session(listener, cancel):
+                instrument.record_stage('gui_session', time.perf_counter()-session_start)
+                if prerender is not None:
+                    with stage('prerender_wait'):
+                        prerender.close()
+                    print('Prerendered %d invoices during the session.' % prerender.rendered)
+                return write(listener, cancel)
+            final_end = gui.run_session(tabl, included, MONTH, YEAR, reminders,
+                                        commit, START_TIME, write_session)
+            if prerender is not None:
+                prerender.close(False)
+
+            # check if we completed the main program all the way through or not
+            # - if we did not, then exit with an error
+            if final_end == False:
+                exit('Failed to complete full program.')
+    except InvoiceError as err:
+        exit(str(err))
+
+    ## main program done
+    print('Main program done.')
+
+    # total total sum
+    print('Total: ' + format_money([total])[0])
+
+    # run report and profile next to the outputs
+    profile_path = instrument.stop_profile(profiler, dirs['path'])
+    if profile_path is not None:
+        print('Profile written to %s.' % profile_path)
+    instrument.save_report(dirs['path']+'/run_report.json', {
+        'month': MONTH, 'year': YEAR, 'rows': int(tabl.shape[0]),
+        'included': int(included.sum()), 'total': total/100, 'total_cents': total,
+        'jobs': max(1, args.jobs), 'elapsed': round(time.perf_counter()-START_TIME, 3)})
+
+    # --------------------------------------------------------------------------
+    # ## RUN AUX PROGRAM
+    # string_exe = 'python code/aux.py ' + path + ' ' + 'data_'+MONTH+'_'+YEAR+'.xlsx'
+    # os.system(string_exe)
+
+    print('Complete!!!!!')
+    return
+
+##### --from/--to and --businesses: batch runs (see MONTH RANGE and BUSINESSES)
+def main_batch(args):
+    if args.start is not None or args.end is not None:
+        if args.start is None or args.end is None:
+            exit('Give both --from and --to, e.g. --from "July 2019" --to "December 2019".')
+        if args.month is not None:
+            exit('Give either MONTH YEAR or --from/--to, not both.')
+    elif args.month is None or args.year is None:
+        exit('Missing MONTH and/or YEAR argument.')
+    if args.businesses is not None and args.batch is not None:
+        exit('With --businesses, give the adjustments files in its ADJUSTMENTS column.')
+    profiler = instrument.start_profile(args.profile)
+
+    try:
+        if args.start is not None:
+            months = month_range(args.start, args.end)
         else:
-            # path
-            doc_path = invoice_doc_path_gg
-        # load master doc
-        doc = Document(doc_path)
-        # add page break
-        doc.add_page_break()
-        # compose it
-        composer = Composer(doc)
-        # merge it with the temp doc
-        composer.append(temp)
-
-        # save the final output
-        composer.save(doc_path)
-    else:
-        # check for DIRECTION
-        if tabl['DIRECTION'][i].strip() == 'PP':
-            # path
-            temp_emails_path = emails_path_pp+'/'+tabl['EMAIL_ADDRESS'][i].strip()
+            invoice_date(args.month, args.year)
+            months = [(args.month, args.year)]
+        # businesses: one from the working directory unless given a spec
+        if args.businesses is not None:
+            businesses = read_businesses(args.businesses)
         else:
-            # path
-            temp_emails_path = emails_path_gg+'/'+tabl['EMAIL_ADDRESS'][i].strip()
-        # make directory
-        os.mkdir(temp_emails_path)
-        # temp email paths word doc file name
-        temp_emails_path_doc = temp_emails_path+'/invoice_'+MONTH+'_'
-        temp_emails_path_doc += '_'.join(tabl['FIRST'][i].strip().lower().split())
-        temp_emails_path_doc += '_'
-        temp_emails_path_doc += tabl['LAST'][i].strip().lower()
-        temp_emails_path_doc += '.docx'
-        # save doc
-        temp.save(temp_emails_path_doc)
-
-print("Files written.")
-
-# ------------------------------------------------------------------------------
-# ------------------------------------------------------------------------------
-# CREATE EXCEL SHEET for output
-# drop columns not needed
-tabl.drop(['OWNER', 'EMAIL_ADDRESS',
-            'COND_CHARGE', 'FILT_CHARGE',
-            'COND_MONTHS', 'FILT_MONTHS',
-            'RP_INDICATOR',
-            'Z_INDICATOR', 'V_INDICATOR'], axis=1, inplace=True)
-
-# taken from:
-# https://xlsxwriter.readthedocs.io/example_pandas_column_formats.html
-# Create a Pandas Excel writer using XlsxWriter as the engine
-invoice_data = path+'/data_'+MONTH+'_'+YEAR+'.xlsx' # file path
-writer = pd.ExcelWriter(invoice_data, engine='xlsxwriter')
-# Convert the dataframe to an XlsxWriter Excel object.
-tabl.to_excel(writer, sheet_name='Sheet1', index= False)
-# Get the xlsxwriter workbook and worksheet objects.
-workbook  = writer.book
-worksheet = writer.sheets['Sheet1']
-# Set the column width and format.
-worksheet.set_column('A:B', 18, None) # first, last
-worksheet.set_column('C:D', 18*1.5, None) # street, city
-worksheet.set_column('E:E', 18*2.5, None) # my notes
-worksheet.set_column('F:F', 18, None) # monthly charge
-worksheet.set_column('G:G', 18, None) # additional charge
-worksheet.set_column('H:H', 18*2.5, None) # add charge notes
-worksheet.set_column('I:I', 18*1.5, None) # cust reminder
-worksheet.set_column('J:K', 18, None) # total, included
-# Close the Pandas Excel writer and output the Excel file.
-writer.save()
-
-# ------------------------------------------------------------------------------
-# ------------------------------------------------------------------------------
-# CREATE EXCEL SHEET for shorter output
-# 'short' path
-short_path = path+'/short_data_'+MONTH+'_'+YEAR+'.xlsx'
-# create shorter data
-short_tabl = tabl[['LAST','STREET_ADDRESS','ADD_CHARGE_NOTES']].copy()
-# add month service column
-short_tabl[MONTH+' '+YEAR] = tabl['MONTHLY_CHARGE'].copy()
-# add recrods column
-short_tabl['Records'] = ['']*N
-
-# create excel output
-short_writer = pd.ExcelWriter(short_path, engine='xlsxwriter')
-# Convert the dataframe to an XlsxWriter Excel object.
-short_tabl.to_excel(short_writer, sheet_name='Sheet1', index= False)
-# Get the xlsxwriter workbook and worksheet objects.
-short_workbook  = short_writer.book
-short_workbook = short_writer.sheets['Sheet1']
-# Set the column width and format.
-short_workbook.set_column('A:A', 15, None) # last
-short_workbook.set_column('B:B', 25, None) # street
-short_workbook.set_column('C:C', 40, None) # add charge notes
-short_workbook.set_column('D:D', 15, None) # monthly service
-short_workbook.set_column('E:E', 15, None) # records
-# MARGINS
-short_workbook.set_margins(left=0.1, right=0.1, top=0.1, bottom=0.1)
-# Close the Pandas Excel writer and output the Excel file.
-short_writer.save()
-
-# ------------------------------------------------------------------------------
-# ------------------------------------------------------------------------------
-## main program done
-print('Main program done.')
-
-# total total sum
-print('Total: ${:,.2f}'.format(tabl['TOTAL'].values.sum()))
-
-# ------------------------------------------------------------------------------
-# ------------------------------------------------------------------------------
-# ## RUN AUX PROGRAM
-# string_exe = 'python code/aux.py ' + path + ' ' + 'data_'+MONTH+'_'+YEAR+'.xlsx'
-# os.system(string_exe)
-
-# ------------------------------------------------------------------------------
-# ------------------------------------------------------------------------------
-
-print('Complete!!!!!')
+            businesses = [{'name': '', 'paths': template_paths(),
+                           'out_root': 'invoices', 'adjust_path': args.batch}]
+        for business in businesses:
+            try:
+                check_files(business['paths'])
+            except InvoiceError as err:
+                if business['name'] == '':
+                    raise
+                raise InvoiceError(business['name']+': '+str(err))
+
+        # client tables - once per business for every month
+        tasks = []
+        for business in businesses:
+            tabl = load_table(business['paths']['invoice_data_template'])
+            for month, year in months:
+                tasks.append((tabl, month, year, business['paths'],
+                              business['adjust_path'], business['out_root']))
+
+        # previously rendered invoices
+        cache = None
+        if not args.no_cache:
+            from render import RenderCache
+            cache = RenderCache(args.cache_dir, args.cache_size*1024*1024)
+
+        options = {'cache': cache, 'incremental': not args.rebuild,
+                   'shard_size': max(1, args.shard_size),
+                   'volumes': args.volumes, 'fast': args.fast_render}
+        summaries = write_tasks(tasks, max(1, args.jobs), options)
+    except InvoiceError as err:
+        exit(str(err))
+
+    ## main program done
+    print('Main program done.')
+    names = [business['name'] for business in businesses for month in months]
+    for name, summary in zip(names, summaries):
+        prefix = name+' ' if name != '' else ''
+        print(prefix + '%s %s: %d of %d clients, %s in %.2f s -> %s' % (
+            summary['month'], summary['year'], summary['included'],
+            summary['rows'], format_money([summary['total_cents']])[0],
+            summary['elapsed'], summary['path']))
+    print('Total: ' + format_money([sum([summary['total_cents'] for summary in summaries])])[0])
+    print('%d month directories written in %.2f s.' % (len(summaries), time.perf_counter()-START_TIME))
+
+    profile_path = instrument.stop_profile(profiler, '.')
+    if profile_path is not None:
+        print('Profile written to %s.' % profile_path)
+
+    print('Complete!!!!!')
+    return
+
+if __name__ == '__main__':
+    main()
 
 # ------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------
@@ -0,0 +1,73 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# money for invoice.py
+# - amounts are kept as int64 cents from the workbook to the outputs, so sums
+#   are exact; dollars only show up where amounts are read in or shown
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+# LIBRARIES
+
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# CONSTANTS
+
+##### money columns of the client table, all in cents
+money_cols = ['MONTHLY_CHARGE', 'ADD_CHARGE', 'COND_CHARGE', 'FILT_CHARGE', 'TOTAL']
+
+##### excel number format of the money cells
+excel_format = '$#,##0.00'
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# CONVERSIONS
+
+##### dollars (floats, e.g. a workbook column) -> int64 cents, blanks are 0
+# - halves round away from zero like decimal_cents, so a formula column and
+#   the same amount typed in give the same cents
+# -- the cents are first rounded to 6 places to drop binary float error,
+# -- e.g. 2.5*1.05 is 262.49999999999997 cents
+def to_cents(values):
+    dollars = np.asarray(values, dtype=float)
+    with np.errstate(invalid='ignore'):
+        cents = np.round(dollars*100, 6)
+        cents = np.sign(cents)*np.floor(np.abs(cents)+0.5)
+    return np.nan_to_num(cents).astype(np.int64)
+
+##### Decimal dollars -> int cents, halves round away from zero
+def decimal_cents(value):
+    return int((value*100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+##### int64 cents -> float dollars, for the spreadsheets
+def to_dollars(values):
+    return np.asarray(values, dtype=np.int64)/100
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# FORMATTING
+
+##### currency strings for cents, e.g. 123456 -> '$1,234.56', -50 -> '$-0.50'
+# - each distinct amount is formatted once, charges repeat a lot
+def format_money(values):
+    values = np.asarray(values, dtype=np.int64)
+    if values.size == 0:
+        return []
+    codes, uniques = pd.factorize(values)
+    whole = np.abs(uniques) // 100
+    part = np.abs(uniques) % 100
+    sign = np.where(uniques < 0, '-', '')
+    strs = np.array(['$%s%s.%02d' % (s, '{:,}'.format(w), p)
+                     for s, w, p in zip(sign.tolist(), whole.tolist(), part.tolist())],
+                    dtype=object)
+    return strs[codes].tolist()
+
+##### cents as typed in, e.g. 123456 -> '1234.56'
+def format_amount(value):
+    value = int(value)
+    sign = '-' if value < 0 else ''
+    return '%s%d.%02d' % (sign, abs(value) // 100, abs(value) % 100)
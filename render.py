@@ -0,0 +1,499 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# rendering of the word templates for invoice.py
+# - a job is (row, template path, data); rendered docs come back in job order
+#   as (row, template path, doc)
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+# LIBRARIES
+
+import os
+import io
+import re
+import json
+import zipfile
+import time
+import copy
+import hashlib
+from collections import deque
+
+from docxtpl import DocxTemplate
+from docx import Document
+from docx.opc.part import XmlPart
+from docx.oxml import parse_xml
+from jinja2 import Environment
+from concurrent.futures import ProcessPoolExecutor
+
+from instrument import record_render
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# TEMPLATE CACHE
+# each word template is read, parsed, patched and compiled once per run and
+# every row gets a fresh instance copied from the parsed package
+# -- a row's copy has its own copies of the parts docxtpl renders into (the
+# -- body, headers, footers, footnotes and doc properties) and shares the
+# -- others, e.g. the styles, which are only read when the doc is saved
+# -- entries are checked against the file's mtime and size, and its hash when
+# -- those change, so a long running process picks up edited templates
+
+##### path -> {'stamp': (mtime, size), 'hash': sha1, 'bytes': raw docx bytes}
+template_cache = {}
+##### sha1 -> raw docx bytes, one copy for paths with the same contents
+template_blobs = {}
+##### raw body xml -> xml patched for jinja (see DocxTemplate.patch_xml)
+patched_sources = {}
+##### sha1 -> parsed python-docx Document, never rendered into itself
+parsed_docs = {}
+##### content types of the parts docxtpl changes when it renders
+rendered_types = set(['application/vnd.openxmlformats-officedocument.wordprocessingml.'+kind
+                      for kind in ['document.main+xml', 'template.main+xml',
+                                   'header+xml', 'footer+xml', 'footnotes+xml']] +
+                     ['application/vnd.openxmlformats-package.core-properties+xml'])
+
+##### jinja environment that compiles each template source only once
+class CachedEnvironment(Environment):
+    def __init__(self, *args, **kwargs):
+        Environment.__init__(self, *args, **kwargs)
+        self.compiled = {} # source -> compiled template
+
+    def from_string(self, source, globals=None, template_class=None):
+        # only plain calls are cached - that is all docxtpl uses
+        if globals is not None or template_class is not None:
+            return Environment.from_string(self, source, globals, template_class)
+        compiled = self.compiled.get(source)
+        if compiled is None:
+            compiled = Environment.from_string(self, source)
+            self.compiled[source] = compiled
+        return compiled
+
+template_env = CachedEnvironment()
+
+##### docx template that reuses the parsed package, the patched xml and the
+##### compiled jinja source
+# - raw, digest: bytes of the template and their hash, the key of parsed_docs
+class CachedDocxTemplate(DocxTemplate):
+    def __init__(self, raw, digest):
+        DocxTemplate.__init__(self, io.BytesIO(raw))
+        self.raw = raw
+        self.digest = digest
+
+    def init_docx(self, reload=True):
+        if not self.docx or (self.is_rendered and reload):
+            self.docx = parsed_copy(self.digest, self.raw)
+            self.is_rendered = False
+
+    def patch_xml(self, src_xml):
+        patched = patched_sources.get(src_xml)
+        if patched is None:
+            patched = DocxTemplate.patch_xml(self, src_xml)
+            patched_sources[src_xml] = patched
+        return patched
+
+    def render(self, context, jinja_env=None, autoescape=False):
+        if jinja_env is None:
+            jinja_env = template_env
+        DocxTemplate.render(self, context, jinja_env, autoescape)
+
+##### raw bytes of a template, re-read only if the file changed
+def template_bytes(path):
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    entry = template_cache.get(path)
+    if entry is None or entry['stamp'] != stamp:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        digest = hashlib.sha1(raw).hexdigest()
+        old = entry
+        entry = {'stamp': stamp, 'hash': digest,
+                 'bytes': template_blobs.setdefault(digest, raw)}
+        template_cache[path] = entry
+        # contents changed -> drop everything compiled from the old version,
+        # unless another path still has those contents
+        if old is not None and old['hash'] != digest:
+            patched_sources.clear()
+            template_env.compiled.clear()
+            if not any(other['hash'] == old['hash'] for other in template_cache.values()):
+                template_blobs.pop(old['hash'], None)
+                parsed_docs.pop(old['hash'], None)
+                fast_templates.pop(old['hash'], None)
+                template_slots.pop(old['hash'], None)
+    return entry['bytes']
+
+##### content hash of a template
+def template_hash(path):
+    template_bytes(path)
+    return template_cache[path]['hash']
+
+##### fresh copy of a parsed template
+# - raw: the template's bytes, parsed if it is not in parsed_docs yet
+# - the shared parts are put in deepcopy's memo, so they are not copied
+def parsed_copy(digest, raw):
+    doc = parsed_docs.get(digest)
+    if doc is None:
+        doc = Document(io.BytesIO(raw))
+        parsed_docs[digest] = doc
+    memo = {id(part): part for part in doc.part.package.iter_parts()
+            if part.content_type not in rendered_types}
+    return copy.deepcopy(doc, memo)
+
+##### fresh template instance for one row
+def new_template(path):
+    raw = template_bytes(path)
+    return CachedDocxTemplate(raw, template_cache[path]['hash'])
+
+##### template hash -> rows a group template shows (see group_slots)
+template_slots = {}
+slot_re = re.compile(r'\{\{\s*M(\d+)\s*\}\}')
+items_re = re.compile(r'\{%[^%]*\bin\s+ITEMS\b')
+tag_re = re.compile(r'<[^>]*>')
+
+##### rows of a group the template shows -> highest N of its M1, M2, ... MN
+##### fields, None if it loops over ITEMS or shows no rows at all
+def group_slots(path):
+    digest = template_hash(path)
+    if digest not in template_slots:
+        text = ''
+        with zipfile.ZipFile(io.BytesIO(template_bytes(path))) as z:
+            for name in z.namelist():
+                if name.startswith('word/') and name.endswith('.xml'):
+                    # fields can be split over runs, the text is joined
+                    text += tag_re.sub('', z.read(name).decode('utf-8'))
+        slots = [int(k) for k in slot_re.findall(text)]
+        if items_re.search(text) or len(slots) == 0:
+            template_slots[digest] = None
+        else:
+            template_slots[digest] = max(slots)
+    return template_slots[digest]
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# RENDER DOCS
+
+# render one job into docx bytes
+# -- runs in the worker processes when jobs is above 1
+# - fast: try the fast path first (see FAST PATH)
+def render_bytes(temp_path, data, fast=False):
+    if fast:
+        doc_bytes = render_fast(temp_path, data)
+        if doc_bytes is not None:
+            return doc_bytes
+    temp = new_template(temp_path)
+    temp.render(data)
+    buf = io.BytesIO()
+    temp.save(buf)
+    return buf.getvalue()
+
+# render one job into docx bytes -> (bytes, seconds it took)
+# -- the worker processes time their own renders
+def render_timed(temp_path, data, fast=False):
+    start = time.perf_counter()
+    doc_bytes = render_bytes(temp_path, data, fast)
+    return doc_bytes, time.perf_counter()-start
+
+# render one job in this process
+# - fast: try the fast path first, which gives docx bytes
+def render_doc(temp_path, data, fast=False):
+    if fast:
+        doc_bytes = render_fast(temp_path, data)
+        if doc_bytes is not None:
+            return doc_bytes
+    temp = new_template(temp_path)
+    temp.render(data)
+    return temp
+
+##### python-docx Document of a doc rendered from a template, docx bytes
+# -- only the parts docxtpl renders into are read from the bytes, the rest is
+# -- shared with the parsed template as in a row's copy (see TEMPLATE CACHE);
+# -- parsing the whole package again costs more than rendering the doc
+def load_doc(temp_path, doc_bytes):
+    doc = parsed_copy(template_hash(temp_path), template_bytes(temp_path))
+    with zipfile.ZipFile(io.BytesIO(doc_bytes)) as z:
+        names = set(z.namelist())
+        for part in doc.part.package.iter_parts():
+            if part.content_type not in rendered_types:
+                continue
+            name = part.partname[1:]
+            if name not in names: # not from this template
+                return Document(io.BytesIO(doc_bytes))
+            if isinstance(part, XmlPart):
+                part._element = parse_xml(z.read(name))
+            else:
+                part._blob = z.read(name)
+    return doc.part.document
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# FAST PATH
+# templates whose only jinja is plain {{ FIELD }} tags in the body are rendered
+# by joining the values into the body xml, without docxtpl or python-docx
+# -- each template is rendered once by docxtpl with a marker for every field;
+# -- the body xml it writes is split on the markers into static chunks and
+# -- field slots, and the other parts of the doc are kept as a ready zip
+# -- values that docxtpl would change (&, <, >, tabs, new lines, ...) and
+# -- templates with other jinja go through docxtpl, so the docs are the same
+
+##### template hash -> compiled template or None, shared by paths with the
+##### same contents, e.g. the templates of two businesses
+fast_templates = {}
+
+field_re = re.compile(r'\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}')
+jinja_re = re.compile(r'\{[\{%#]')
+marker_re = re.compile(r'@@FIELD(\d+)@@')
+unsafe_re = re.compile(r'[&<>\x00-\x1f]')
+# element left empty by blank values, written as <x/> like lxml does
+empty_re = re.compile(r'<([\w:]+)((?: [^<>]*)?)></\1>')
+body_name = 'word/document.xml'
+
+##### compile a template for the fast path, None if it can not be used
+def compile_fast(path):
+    raw = template_bytes(path)
+    temp = new_template(path)
+
+    ##### only plain fields, and only in the body
+    fields = set()
+    with zipfile.ZipFile(io.BytesIO(raw)) as z:
+        for name in z.namelist():
+            if not name.endswith('.xml'):
+                continue
+            src = z.read(name).decode('utf-8')
+            if marker_re.search(src):
+                return None
+            # join tags split over runs the way docxtpl does
+            patched = DocxTemplate.patch_xml(temp, src)
+            if name == body_name:
+                fields.update(field_re.findall(patched))
+                patched = field_re.sub('', patched)
+            if jinja_re.search(patched):
+                return None
+    fields = sorted(fields)
+
+    ##### render with a marker for every field
+    temp.render({field: '@@FIELD%d@@' % k for k, field in enumerate(fields)})
+    buf = io.BytesIO()
+    temp.save(buf)
+
+    ##### split the body, keep the rest
+    static = io.BytesIO()
+    with zipfile.ZipFile(buf) as z, zipfile.ZipFile(static, 'w') as out:
+        for info in z.infolist():
+            if info.filename == body_name:
+                body_info = info
+                body_xml = z.read(info).decode('utf-8')
+            else:
+                out.writestr(info, z.read(info))
+    pieces = marker_re.split(body_xml)
+    chunks = pieces[0::2]
+    slots = [fields[int(k)] for k in pieces[1::2]]
+    # every field has to be in text, not in an attribute
+    for chunk in chunks[:-1]:
+        if chunk.rfind('<') > chunk.rfind('>'):
+            return None
+    return {'chunks': chunks, 'slots': slots, 'static': static.getvalue(),
+            'date_time': body_info.date_time,
+            'compress_type': body_info.compress_type}
+
+##### compiled template, compiled again when the file changes
+def fast_template(path):
+    digest = template_hash(path)
+    if digest not in fast_templates:
+        fast_templates[digest] = compile_fast(path)
+    return fast_templates[digest]
+
+##### render one job on the fast path -> docx bytes, None if it can not be
+def render_fast(temp_path, data):
+    fast = fast_template(temp_path)
+    if fast is None:
+        return None
+    chunks = fast['chunks']
+    pieces = [chunks[0]]
+    blank = False
+    for k, field in enumerate(fast['slots']):
+        # as jinja shows it, missing fields are blank
+        value = str(data[field]) if field in data else ''
+        if unsafe_re.search(value):
+            return None
+        blank = blank or value == ''
+        pieces.append(value)
+        pieces.append(chunks[k+1])
+    body_xml = ''.join(pieces)
+    if blank:
+        body_xml = empty_re.sub(r'<\1\2/>', body_xml)
+    body_xml = body_xml.encode('utf-8')
+
+    ##### add the body to the rest of the doc
+    buf = io.BytesIO(fast['static'])
+    with zipfile.ZipFile(buf, 'a') as z:
+        info = zipfile.ZipInfo(body_name, date_time=fast['date_time'])
+        info.compress_type = fast['compress_type']
+        z.writestr(info, body_xml)
+    return buf.getvalue()
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# RENDER CACHE
+# rendered docs are stored on disk under a hash of the template bytes and the
+# row's data, so a re-run only renders the rows that changed
+# -- the least recently used docs are removed once the cache is over its size
+
+##### bump when a change to the rendering changes the docs it writes
+render_version = '1'
+
+##### cache key of a job: template contents + data placed in it
+def render_key(temp_path, data):
+    h = hashlib.sha256()
+    h.update(render_version.encode())
+    h.update(template_hash(temp_path).encode())
+    # numpy values and the like are keyed by their text, as jinja shows them
+    h.update(json.dumps(data, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+##### directory of rendered docs, bounded in size
+class RenderCache:
+    def __init__(self, cache_dir='.render_cache', max_bytes=1024*1024*1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.put_failed = False # a write failed, e.g. a full disk
+
+    # start counting hits and misses again, e.g. for the next month of a range
+    def reset_counts(self):
+        self.hits = 0
+        self.misses = 0
+        return
+
+    # file of a key -- two level fan out keeps the directories small
+    def key_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key+'.docx')
+
+    # cached docx bytes, or None
+    def get(self, key):
+        key_path = self.key_path(key)
+        try:
+            with open(key_path, 'rb') as f:
+                doc_bytes = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+        # mark it as recently used
+        try:
+            os.utime(key_path)
+        except OSError:
+            pass
+        self.hits += 1
+        return doc_bytes
+
+    # store docx bytes -- written to a temp file first so readers never see
+    # half a doc
+    # -- a failed write (full disk, read only directory) only costs speed, the
+    # -- doc is not cached and the run goes on
+    def put(self, key, doc_bytes):
+        key_path = self.key_path(key)
+        tmp_path = key_path+'.%d.tmp' % os.getpid()
+        try:
+            os.makedirs(os.path.dirname(key_path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(doc_bytes)
+            os.replace(tmp_path, key_path)
+        except OSError as err:
+            if not self.put_failed:
+                print('Render cache: can not write to %s (%s), docs are not cached.'
+                      % (self.cache_dir, err.strerror or err))
+            self.put_failed = True
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        return
+
+    # remove the least recently used docs until under max_bytes
+    def trim(self):
+        entries = []
+        total = 0
+        for dir_path, dir_names, file_names in os.walk(self.cache_dir):
+            for name in file_names:
+                if not name.endswith('.docx'):
+                    continue
+                file_path = os.path.join(dir_path, name)
+                try:
+                    st = os.stat(file_path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, file_path))
+                total += st.st_size
+        entries.sort()
+        for mtime, file_size, file_path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(file_path)
+            except OSError:
+                continue
+            total -= file_size
+        return
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# RENDER JOBS
+
+##### rendered docs in job order: (row, template path, doc)
+# - jobs: any iterable of jobs, it is read as the docs are handed back
+# - no cache, serial: rendered templates
+# - otherwise: docx bytes, from the cache or rendered (in a process pool when
+#   n_jobs is above 1) and handed back in job order
+# -- at most 4 jobs per process are rendered ahead of the doc being handed
+# -- back, so the docs held in memory do not grow with the number of jobs
+# - fast: use the fast path where it applies (see FAST PATH)
+def render_jobs(jobs, n_jobs=1, cache=None, fast=False):
+    pool = None
+    ahead = 0
+    if n_jobs > 1:
+        pool = ProcessPoolExecutor(max_workers=n_jobs)
+        ahead = n_jobs*4
+    pending = deque() # [row, key, template path, data, doc or future or None]
+
+    ##### finish the oldest pending job
+    def finish():
+        i, key, temp_path, data, temp = pending.popleft()
+        if temp is None:
+            start = time.perf_counter()
+            if cache is None:
+                temp = render_doc(temp_path, data, fast)
+                record_render(temp_path, time.perf_counter()-start)
+                return i, temp_path, temp
+            temp = render_bytes(temp_path, data, fast)
+            record_render(temp_path, time.perf_counter()-start)
+        elif not isinstance(temp, bytes):
+            temp, seconds = temp.result()
+            record_render(temp_path, seconds)
+        else:
+            record_render(temp_path, None)
+            return i, temp_path, temp # from the cache
+        if cache is not None:
+            cache.put(key, temp)
+        return i, temp_path, temp
+
+    try:
+        for (i, temp_path, data) in jobs:
+            ##### look up the cache first
+            key = None
+            temp = None
+            if cache is not None:
+                key = render_key(temp_path, data)
+                temp = cache.get(key)
+            ##### then render in the pool
+            if temp is None and pool is not None:
+                temp = pool.submit(render_timed, temp_path, data, fast)
+            pending.append([i, key, temp_path, data, temp])
+            while len(pending) > ahead:
+                yield finish()
+        while len(pending) > 0:
+            yield finish()
+    finally:
+        # also runs when the consumer stops early
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if cache is not None:
+            cache.trim()
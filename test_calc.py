@@ -0,0 +1,120 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# tests of the arithmetic expressions of calc.py
+# - run with: python -m pytest test_calc.py
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+# LIBRARIES
+
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+import calc
+from calc import CalcError, eval_array, eval_cents, eval_number
+from money import to_cents
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# TESTS
+
+##### numbers as they are typed in
+@pytest.mark.parametrize('text, cents', [
+    ('450', 45000), ('12.5', 1250), ('.5', 50), ('7.', 700), (' 3 ', 300),
+    ('$1,250.50', 125050), ('1,234,567.8', 123456780), ('$-5', -500)])
+def test_numbers(text, cents):
+    assert eval_cents(text) == cents
+
+##### commas only go between thousands
+@pytest.mark.parametrize('text', ['1,5', '12,34', '1,000,00', '1,,000', '1,'])
+def test_bad_commas(text):
+    with pytest.raises(CalcError):
+        eval_cents(text)
+
+##### tokens and the tree they parse into
+def test_tokenize_and_parse():
+    assert calc.tokenize('$1,000 - 10%') == [('num', '1000'), ('op', '-'),
+                                             ('num', '10'), ('op', '%')]
+    tree = calc.compile_expr('2 + 3*-4')['tree']
+    assert tree == ('+', ('num', '2'), ('*', ('num', '3'), ('neg', ('num', '4'))))
+    assert calc.compile_expr('MONTHLY_CHARGE*1.05')['names'] == {'MONTHLY_CHARGE'}
+    # parsed once
+    assert calc.compile_expr('2 + 3*-4') is calc.compile_expr('2 + 3*-4')
+
+##### precedence, signs and parentheses
+@pytest.mark.parametrize('text, value', [
+    ('2 + 3*4', '14'), ('(2 + 3)*4', '20'), ('10 - 4 - 3', '3'), ('12/4/3', '1'),
+    ('-2*-3', '6'), ('+5', '5'), ('-(1 + 2)', '-3'), ('1/4', '0.25')])
+def test_arithmetic(text, value):
+    assert eval_number(text) == Decimal(value)
+
+##### x% is x/100, as in a spreadsheet
+@pytest.mark.parametrize('text, cents', [
+    ('10%', 10), ('500 - 10%', 49990), ('500*10%', 5000), ('500*(1 + 10%)', 55000),
+    ('50%%', 1)])
+def test_percent(text, cents):
+    assert eval_cents(text) == cents
+
+##### halves of a cent round away from zero
+def test_rounding():
+    assert eval_cents('0.005') == 1
+    assert eval_cents('-0.005') == -1
+    assert eval_cents('2.50*1.05') == 263
+    assert eval_cents('1/3') == 33
+
+##### anything else is a CalcError, never a python error
+@pytest.mark.parametrize('text', [
+    '', '1 +', '(1', '1)', '1 2', '2**3', 'abc', '__import__("os")', '1; 2',
+    '1e5', '(' * 5000 + '1' + ')' * 5000, '-' * 5000 + '1'])
+def test_bad_expressions(text):
+    with pytest.raises(CalcError):
+        eval_cents(text)
+
+##### division by zero
+@pytest.mark.parametrize('text', ['1/0', '5/(2 - 2)', '1/0%'])
+def test_division_by_zero(text):
+    with pytest.raises(CalcError):
+        eval_cents(text)
+    with pytest.raises(CalcError):
+        eval_array(text, {}, 3)
+
+##### amounts too large for exact cents
+@pytest.mark.parametrize('text', ['99999999999999999999', '1' * 40,
+                                  '-90071992547410', '99999999999*99999999999'])
+def test_overflow(text):
+    with pytest.raises(CalcError):
+        eval_cents(text)
+    with pytest.raises(CalcError):
+        eval_array(text, {}, 1)
+
+##### the largest amount still fits
+def test_largest_amount():
+    assert eval_cents(str(calc.max_dollars)) == calc.max_dollars*100
+
+##### formula columns: evaluated for every row, names are columns
+def test_eval_array():
+    columns = {'MONTHLY_CHARGE': np.array([2.5, 100.0, 0.0]),
+               'COND_CHARGE': np.array([45.0, 45.0, 45.0])}
+    values = eval_array('MONTHLY_CHARGE*1.05 + COND_CHARGE/2', columns, 3)
+    assert to_cents(values).tolist() == [2513, 12750, 2250]
+    # constants are spread over the rows
+    assert eval_array('30', columns, 3).tolist() == [30.0, 30.0, 30.0]
+    with pytest.raises(CalcError):
+        eval_array('NOPE + 1', columns, 3)
+    with pytest.raises(CalcError):
+        eval_array('MONTHLY_CHARGE/MONTHLY_CHARGE', columns, 3)
+
+##### a formula and the same amount typed in give the same cents
+def test_formula_rounds_like_typed():
+    dollars = np.arange(100, 20001)/100
+    values = to_cents(eval_array('MONTHLY_CHARGE*1.05', {'MONTHLY_CHARGE': dollars},
+                                 len(dollars)))
+    typed = [eval_cents('%.2f*1.05' % d) for d in dollars]
+    assert values.tolist() == typed
+
+##### names are not numbers in a typed amount
+def test_names_in_typed_amounts():
+    with pytest.raises(CalcError):
+        eval_cents('MONTHLY_CHARGE')
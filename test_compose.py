@@ -0,0 +1,99 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# tests of the master composition of compose.py
+# - a master that spills its body to disk has to be the same doc as one that
+#   keeps it in memory (see SPILL)
+# - run with: python -m pytest test_compose.py
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+# LIBRARIES
+
+import io
+import random
+import zipfile
+
+import docx
+import pytest
+from docx import Document
+from docx.oxml import parse_xml
+
+import bench
+import compose
+import render
+from compose import FastComposer
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# HELPERS
+
+##### the bench templates, one with bookmarks and drawing ids, one with two
+##### sections
+@pytest.fixture(scope='module')
+def templates(tmp_path_factory):
+    template_dir = str(tmp_path_factory.mktemp('templates'))
+    bench.make_templates(template_dir)
+
+    ##### bookmarks and a drawing in the body, a drawing in the header
+    doc = docx.Document()
+    doc.add_paragraph('{{ FIRST }} {{ LAST }}')
+    para = doc.add_paragraph('Total: {{ TOTAL }}')
+    para._p.insert(0, parse_xml(
+        '<w:bookmarkStart xmlns:w="%s" w:id="0" w:name="total"/>' % compose.NS['w']))
+    para._p.append(parse_xml(
+        '<w:bookmarkEnd xmlns:w="%s" w:id="0"/>' % compose.NS['w']))
+    for container in [doc.add_paragraph(), doc.sections[0].header.paragraphs[0]]:
+        container._p.append(parse_xml(
+            '<w:r xmlns:w="%s" xmlns:wp="%s"><w:drawing><wp:inline>'
+            '<wp:docPr id="1" name="logo"/></wp:inline></w:drawing></w:r>'
+            % (compose.NS['w'], compose.NS['wp'])))
+    doc.save(template_dir+'/marks_template.docx')
+
+    ##### two sections
+    doc = docx.Document()
+    doc.add_paragraph('{{ FIRST }} {{ LAST }}')
+    doc.add_section()
+    doc.add_paragraph('Total: {{ TOTAL }}')
+    doc.save(template_dir+'/sections_template.docx')
+    return template_dir
+
+##### master of the docs rendered from the named templates -> parts
+def master_parts(templates, names, spill_size):
+    rng = random.Random(0)
+    fpage = templates+'/fpage.docx'
+    composer = FastComposer(Document(fpage), spill_size=spill_size)
+    for name in names:
+        path = templates+'/'+name+'.docx'
+        data = {'FIRST': 'First%d' % rng.randint(0, 99), 'LAST': 'Last',
+                'TOTAL': '$%d.00' % rng.randint(0, 999)}
+        composer.doc.add_page_break()
+        composer.append(render.render_doc(path, data), path)
+    buf = io.BytesIO()
+    composer.save(buf)
+    with zipfile.ZipFile(buf) as z:
+        return {name: z.read(name) for name in z.namelist()}
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# TESTS
+
+##### spilled masters are the same docs, part for part
+@pytest.mark.parametrize('names', [
+    ['invoice_template', 'invoice_template_z', 'invoice_template_mult']*10,
+    ['marks_template', 'invoice_template', 'marks_template']*8,
+    (['invoice_template', 'marks_template']*6 + ['sections_template'])*3 +
+    ['marks_template', 'invoice_template']*4])
+@pytest.mark.parametrize('spill_size', [1, 7, 40])
+def test_spill_same_doc(templates, names, spill_size):
+    assert master_parts(templates, names, spill_size) == \
+           master_parts(templates, names, None)
+
+##### the master in memory stays small
+def test_spill_bounds_body(templates):
+    composer = FastComposer(Document(templates+'/fpage.docx'), spill_size=30)
+    path = templates+'/invoice_template.docx'
+    for k in range(50):
+        composer.doc.add_page_break()
+        composer.append(render.render_doc(path, {'FIRST': str(k)}), path)
+        assert len(composer.doc.element.body) < 30 + 20
+    assert composer.spill is not None
@@ -0,0 +1,165 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# tests of the invoice groups of invoice.py (see INVOICE GROUPS)
+# - run with: python -m pytest test_groups.py
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+# LIBRARIES
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import bench
+import invoice
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# HELPERS
+
+paths = {'invoice_template': 'plain', 'invoice_template_mult': 'mult',
+         'invoice_template_z': 'z', 'invoice_template_z_gg': 'z_gg',
+         'invoice_template_v': 'v'}
+
+##### the mult template is read for the rows it shows, the others are only
+##### named: a real one is made for the tests
+@pytest.fixture(autouse=True, scope='module')
+def templates(tmp_path_factory):
+    template_dir = str(tmp_path_factory.mktemp('templates'))
+    bench.make_templates(template_dir)
+    paths['invoice_template_mult'] = template_dir+'/invoice_template_mult.docx'
+    return template_dir
+
+##### cleaned client table, as read_table and write_outputs leave it
+# - rows: dicts of the columns that differ from a plain PP client
+def make_tabl(rows):
+    records = []
+    for k, row in enumerate(rows):
+        record = {'OWNER': 'owner', 'DIRECTION': 'PP', 'FIRST': 'First%d' % k,
+                  'LAST': 'Last%d' % k, 'STREET_ADDRESS': '%d Main St' % k,
+                  'CITY_ADDRESS': 'Springfield', 'MY_NOTES': '',
+                  'MONTHLY_CHARGE': 10000 + k, 'EMAIL_ADDRESS': 'nan', 'EMAIL_IND': 0,
+                  'COND_CHARGE': 4500, 'FILT_CHARGE': 2000,
+                  'COND_MONTHS': 'exclude', 'FILT_MONTHS': 'exclude',
+                  'RP_INDICATOR': 0, 'Z_INDICATOR': 0, 'V_INDICATOR': 0,
+                  'GROUP': '', 'ADD_CHARGE': 0, 'ADD_CHARGE_NOTES': '',
+                  'CUST_REMINDER': ''}
+        record.update(row)
+        records.append(record)
+    tabl = pd.DataFrame(records)
+    for col in invoice.money_cols[:-1]:
+        tabl[col] = tabl[col].astype(np.int64)
+    tabl['TOTAL'] = tabl['MONTHLY_CHARGE'] + tabl['ADD_CHARGE']
+    return tabl
+
+##### render jobs of a table: [(row, template, data)], the mult template as 'mult'
+def jobs_of(tabl, included=None):
+    if included is None:
+        included = np.ones(tabl.shape[0], dtype=int)
+    tabl['INCLUDED'] = included
+    jobs = invoice.build_jobs(tabl, included, 'September', '2019',
+                              'September 30, 2019', paths, chunk_rows=4)
+    return [(i, 'mult' if temp == paths['invoice_template_mult'] else temp, data)
+            for i, temp, data in jobs]
+
+##### monthly charges shown on a group's invoice, M1, M2, ...
+def monthly_of(data):
+    shown = []
+    k = 1
+    while 'M%d' % k in data:
+        shown.append(data['M%d' % k])
+        k += 1
+    return shown
+
+##### monthly charge of a row as shown on the invoices
+def money(cents):
+    return invoice.format_money([cents])[0]
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# TESTS
+
+##### every rp group gets its own M1..M3, not the first group's
+def test_rp_groups_have_their_own_months():
+    tabl = make_tabl([{'RP_INDICATOR': 1}]*6 + [{}])
+    jobs = jobs_of(tabl)
+    assert [(i, temp) for i, temp, data in jobs] == [(2, 'mult'), (5, 'mult'), (6, 'plain')]
+    assert monthly_of(jobs[0][2]) == [money(10000), money(10001), money(10002)]
+    assert monthly_of(jobs[1][2]) == [money(10003), money(10004), money(10005)]
+
+##### a last rp group of fewer than three still gets its invoice
+def test_short_last_rp_group():
+    tabl = make_tabl([{'RP_INDICATOR': 1}]*5)
+    jobs = jobs_of(tabl)
+    assert [i for i, temp, data in jobs] == [2, 4]
+    assert monthly_of(jobs[1][2]) == [money(10003), money(10004)]
+    assert 'M3' not in jobs[1][2]
+
+##### rows with the same key are one invoice, however far apart they are
+def test_keyed_groups_far_apart():
+    tabl = make_tabl([{'GROUP': 'A'}, {}, {'GROUP': 'B'}, {},
+                      {'GROUP': 'B'}, {}, {}, {}, {}, {'GROUP': 'A'}])
+    group, group_last = invoice.build_groups(tabl, np.ones(10, dtype=int))
+    assert group[0] == group[9] and group[2] == group[4] and group[0] != group[2]
+    assert (group[[1, 3, 5, 6, 7, 8]] == -1).all()
+    jobs = jobs_of(tabl)
+    assert [(i, temp) for i, temp, data in jobs] == \
+           [(1, 'plain'), (3, 'plain'), (4, 'mult'), (5, 'plain'), (6, 'plain'),
+            (7, 'plain'), (8, 'plain'), (9, 'mult')]
+    assert monthly_of(jobs[2][2]) == [money(10002), money(10004)]
+    assert monthly_of(jobs[7][2]) == [money(10000), money(10009)]
+
+##### excluded rows are not members, the group ends at its last included row
+def test_excluded_members():
+    tabl = make_tabl([{'GROUP': 'A'}, {}, {'GROUP': 'A'}, {}, {'GROUP': 'A'}])
+    included = np.array([1, 1, 1, 1, 0])
+    jobs = jobs_of(tabl, included)
+    assert [(i, temp) for i, temp, data in jobs] == [(1, 'plain'), (2, 'mult'), (3, 'plain')]
+    assert monthly_of(jobs[1][2]) == [money(10000), money(10002)]
+
+    # excluded rp rows do not take a place in the threes
+    tabl = make_tabl([{'RP_INDICATOR': 1}]*4)
+    jobs = jobs_of(tabl, np.array([1, 0, 1, 1]))
+    assert [i for i, temp, data in jobs] == [3]
+    assert monthly_of(jobs[0][2]) == [money(10000), money(10002), money(10003)]
+
+##### an rp row with a key is in its keyed group, not in the threes
+def test_keyed_rp_row_leaves_the_threes():
+    tabl = make_tabl([{'RP_INDICATOR': 1}, {'RP_INDICATOR': 1, 'GROUP': 'X'},
+                      {'RP_INDICATOR': 1}, {'RP_INDICATOR': 1}, {}, {'GROUP': 'X'}])
+    jobs = jobs_of(tabl)
+    assert [(i, temp) for i, temp, data in jobs] == [(3, 'mult'), (4, 'plain'), (5, 'mult')]
+    assert monthly_of(jobs[0][2]) == [money(10000), money(10002), money(10003)]
+    assert monthly_of(jobs[2][2]) == [money(10001), money(10005)]
+
+##### the total of a group is the sum of its cents, not of formatted strings
+def test_group_total_from_cents():
+    tabl = make_tabl([{'GROUP': 'A', 'MONTHLY_CHARGE': 10, 'ADD_CHARGE': 20},
+                      {'GROUP': 'A', 'MONTHLY_CHARGE': 123456789, 'ADD_CHARGE': 1},
+                      {'GROUP': 'A', 'MONTHLY_CHARGE': 33333, 'ADD_CHARGE': -5}])
+    jobs = jobs_of(tabl)
+    assert len(jobs) == 1
+    data = jobs[0][2]
+    assert data['TOTAL'] == '$1,234,901.48'
+    assert data['A1'] == '$0.20' and data['A3'] == '$-0.05'
+    assert [item['LAST'] for item in data['ITEMS']] == ['Last0', 'Last1', 'Last2']
+
+##### a group larger than the M1..M3 of the mult template is an error
+def test_group_larger_than_template():
+    tabl = make_tabl([{'GROUP': 'A'}]*4 + [{}])
+    with pytest.raises(invoice.InvoiceError, match='row 5 has 4 rows'):
+        jobs_of(tabl)
+
+##### a template looping over ITEMS shows every row of a group
+def test_items_template_any_size(templates, monkeypatch):
+    path = templates+'/items_template.docx'
+    bench.make_doc(path, ['{%p for item in ITEMS %}',
+                          '{{ item.LAST }} {{ item.MONTHLY_CHARGE }}',
+                          '{%p endfor %}',
+                          'Total: {{ TOTAL }}'])
+    monkeypatch.setitem(paths, 'invoice_template_mult', path)
+    tabl = make_tabl([{'GROUP': 'A'}]*5)
+    jobs = jobs_of(tabl)
+    assert [(i, temp) for i, temp, data in jobs] == [(4, 'mult')]
+    assert len(jobs[0][2]['ITEMS']) == 5
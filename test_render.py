@@ -0,0 +1,144 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# tests of the fast path renderer of render.py (see FAST PATH)
+# - the fast path has to write the same docs as docxtpl, part for part
+# - run with: python -m pytest test_render.py
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+# LIBRARIES
+
+import io
+import os
+import random
+import shutil
+import zipfile
+
+import pytest
+from docx import Document
+from docxtpl import DocxTemplate
+
+import bench
+import render
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# HELPERS
+
+##### fields of the bench templates
+fields = ['DATE', 'FIRST', 'LAST', 'STREET_ADDRESS', 'CITY_ADDRESS', 'MONTH', 'YEAR',
+          'MONTHLY_CHARGE', 'ADD_CHARGE', 'ADD_CHARGE_NOTES', 'TOTAL', 'CUST_REMINDER',
+          'M1', 'A1', 'A1_NOTES', 'M2', 'A2', 'A2_NOTES', 'M3', 'A3', 'A3_NOTES']
+
+##### the five minimal templates of the benchmark and one with an if block
+@pytest.fixture(scope='module')
+def templates(tmp_path_factory):
+    template_dir = str(tmp_path_factory.mktemp('templates'))
+    bench.make_templates(template_dir)
+    bench.make_doc(template_dir+'/if_template.docx',
+                   ['{{ FIRST }} {{ LAST }}',
+                    '{% if ADD_CHARGE %}Additional: {{ ADD_CHARGE }}{% endif %}',
+                    'Total: {{ TOTAL }}'])
+    return template_dir
+
+##### parts of a docx: name -> bytes
+def zip_parts(doc_bytes):
+    with zipfile.ZipFile(io.BytesIO(doc_bytes)) as z:
+        return {name: z.read(name) for name in z.namelist()}
+
+##### the doc docxtpl writes
+def docxtpl_bytes(path, data):
+    temp = DocxTemplate(path)
+    temp.render(data)
+    buf = io.BytesIO()
+    temp.save(buf)
+    return buf.getvalue()
+
+##### random values of the kind the invoices hold
+def random_data(rng):
+    words = ['Ann', 'Mary Ann', "O'Neil", 'Main St.', '$1,234.56', '$-0.50',
+             'September 30, 2019', '"quoted"', 'Ünïcode', '12', '#4']
+    return {field: ' '.join(rng.choice(words) for _ in range(rng.randint(1, 3)))
+            for field in fields}
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# TESTS
+
+##### plain templates: the fast path is used and writes docxtpl's doc
+@pytest.mark.parametrize('name', ['fpage', 'invoice_template', 'invoice_template_z',
+                                  'invoice_template_v', 'invoice_template_mult'])
+def test_fast_path_matches_docxtpl(templates, name):
+    path = templates+'/'+name+'.docx'
+    rng = random.Random(name)
+    for _ in range(20):
+        data = random_data(rng)
+        fast_bytes = render.render_fast(path, data)
+        assert fast_bytes is not None
+        assert zip_parts(fast_bytes) == zip_parts(docxtpl_bytes(path, data))
+
+##### values docxtpl changes go through docxtpl, blank values do not
+@pytest.mark.parametrize('value', ['Smith & Sons', 'a < b', 'bell\x07', 'tab\there',
+                                   'line\nbreak', ''])
+def test_fallback_values(templates, value):
+    path = templates+'/invoice_template.docx'
+    data = random_data(random.Random(0))
+    data['LAST'] = value
+    fast_bytes = render.render_fast(path, data)
+    if value == '':
+        # a blank value leaves an empty element, written as <w:t/>
+        assert fast_bytes is not None
+    else:
+        assert fast_bytes is None
+    assert zip_parts(render.render_bytes(path, data, fast=True)) == \
+           zip_parts(docxtpl_bytes(path, data))
+
+##### missing fields are blank, as jinja shows them
+def test_missing_fields(templates):
+    path = templates+'/invoice_template.docx'
+    data = {'FIRST': 'Ann', 'TOTAL': '$12.00'}
+    assert zip_parts(render.render_fast(path, data)) == zip_parts(docxtpl_bytes(path, data))
+
+##### templates with other jinja are not compiled for the fast path
+def test_if_template_falls_back(templates):
+    path = templates+'/if_template.docx'
+    assert render.fast_template(path) is None
+    for add_charge in ['', '$45.00']:
+        data = {'FIRST': 'Ann', 'LAST': 'Lee', 'ADD_CHARGE': add_charge, 'TOTAL': '$1.00'}
+        assert render.render_fast(path, data) is None
+        assert zip_parts(render.render_bytes(path, data, fast=True)) == \
+               zip_parts(docxtpl_bytes(path, data))
+
+##### two paths with the same contents, then one of them is edited
+def test_shared_template_edited(templates, tmp_path):
+    path_a = str(tmp_path/'a.docx')
+    path_b = str(tmp_path/'b.docx')
+    shutil.copy(templates+'/invoice_template.docx', path_a)
+    shutil.copy(templates+'/invoice_template.docx', path_b)
+    data = random_data(random.Random(1))
+    for fast in [False, True]:
+        render.render_bytes(path_a, data, fast)
+        render.render_bytes(path_b, data, fast)
+    assert render.template_hash(path_a) == render.template_hash(path_b)
+
+    # a is edited, b still has the old contents
+    shutil.copy(templates+'/invoice_template_z.docx', path_a)
+    os.utime(path_a, ns=(0, 1))
+    for fast in [False, True]:
+        assert zip_parts(render.render_bytes(path_a, data, fast)) == \
+               zip_parts(docxtpl_bytes(path_a, data))
+        assert zip_parts(render.render_bytes(path_b, data, fast)) == \
+               zip_parts(docxtpl_bytes(path_b, data))
+
+##### docs loaded from rendered bytes save as a full parse of them does
+@pytest.mark.parametrize('name', ['fpage', 'invoice_template', 'invoice_template_mult'])
+def test_load_doc(templates, name):
+    path = templates+'/'+name+'.docx'
+    data = random_data(random.Random(name))
+    for fast in [False, True]:
+        doc_bytes = render.render_bytes(path, data, fast)
+        loaded = io.BytesIO()
+        render.load_doc(path, doc_bytes).save(loaded)
+        parsed = io.BytesIO()
+        Document(io.BytesIO(doc_bytes)).save(parsed)
+        assert zip_parts(loaded.getvalue()) == zip_parts(parsed.getvalue())
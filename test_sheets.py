@@ -0,0 +1,54 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# tests of the spreadsheets of invoice.py (see write_rows)
+# - the rows written a chunk at a time have to be the cells pandas.to_excel
+#   wrote before
+# - run with: python -m pytest test_sheets.py
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+# LIBRARIES
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+import invoice
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# HELPERS
+
+##### a table with the kinds of values the client tables hold
+def odd_tabl(N):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'LAST': [['Lee', '', np.nan, None, '=1+1', 'http://a.b', 'Ünïcode'][k % 7]
+                 for k in range(N)],
+        'MONTHLY_CHARGE': rng.integers(0, 10**6, N).astype(np.int64)/100,
+        'EMAIL_IND': rng.integers(0, 2, N),
+        'RATE': [[0.5, np.nan, 2.25][k % 3] for k in range(N)],
+        'FLAG': [k % 2 == 0 for k in range(N)],
+        'COUNT': pd.array([[1, None, 3][k % 3] for k in range(N)], dtype='Int64')})
+
+##### the cells of the first sheet: [[(value, type)]]
+def sheet_cells(path):
+    sheet = openpyxl.load_workbook(path).active
+    return [[(cell.value, type(cell.value)) for cell in row]
+            for row in sheet.iter_rows()]
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# TESTS
+
+##### rows written in chunks are the cells of to_excel
+@pytest.mark.parametrize('N, chunk_rows', [(0, 1000), (1, 1000), (25, 4), (50, 1000)])
+def test_rows_match_to_excel(tmp_path, N, chunk_rows):
+    tabl = odd_tabl(N)
+    with pd.ExcelWriter(tmp_path/'pandas.xlsx', engine='xlsxwriter') as writer:
+        tabl.to_excel(writer, sheet_name='Sheet1', index=False)
+    workbook, worksheet = invoice.open_sheet(str(tmp_path/'rows.xlsx'))
+    invoice.write_rows(worksheet, tabl, chunk_rows)
+    workbook.close()
+    assert sheet_cells(tmp_path/'rows.xlsx') == sheet_cells(tmp_path/'pandas.xlsx')